@@ -0,0 +1,99 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+
+class ResponseCache():
+
+    def __init__(self, path, ttl=86400, max_entries=1000000):
+        """
+        Cache of JSON-serializable API results in a SQLite database on local disk.
+
+        ttl is the time to live in seconds, either one number or a dict per
+        endpoint (with the key None as default for the other endpoints)
+        max_entries is the maximum number of entries; the least recently used
+        entries are removed when it is exceeded
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = Counter()
+        self.misses = Counter()
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS cache (endpoint TEXT, key TEXT, value TEXT, '
+                                    'created REAL, accessed REAL, PRIMARY KEY (endpoint, key))')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+
+    def get(self, endpoint, key):
+        return self.get_many(endpoint, [key]).get(key)
+
+    def get_many(self, endpoint, keys):
+        """
+        :return: Dict: {key: value} of the keys that are cached and not expired
+        """
+        keys = list(set(keys))
+        now = time.time()
+        min_created = now - self._get_ttl(endpoint)
+        found = {}
+        with self.lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i+500]
+                rows = self.connection.execute(
+                    'SELECT key, value FROM cache WHERE endpoint = ? AND created >= ? AND key IN ({})'.format(
+                        ','.join('?' * len(chunk))), [endpoint, min_created] + chunk)
+                found.update((key, json.loads(value)) for key, value in rows)
+            if found:
+                with self.connection:
+                    self.connection.executemany('UPDATE cache SET accessed = ? WHERE endpoint = ? AND key = ?',
+                                                [(now, endpoint, key) for key in found])
+        self.hits[endpoint] += len(found)
+        self.misses[endpoint] += len(keys) - len(found)
+        return found
+
+    def set(self, endpoint, key, value):
+        self.set_many(endpoint, {key: value})
+
+    def set_many(self, endpoint, values):
+        """
+        :param values: Dict: {key: value}
+        """
+        now = time.time()
+        with self.lock:
+            with self.connection:
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO cache (endpoint, key, value, created, accessed) VALUES (?, ?, ?, ?, ?)',
+                    [(endpoint, key, json.dumps(value), now, now) for key, value in values.items()])
+                self._evict()
+
+    def stats(self):
+        """
+        :return: Dict: {endpoint: {hits, misses}}
+        """
+        return {endpoint: {'hits': self.hits[endpoint], 'misses': self.misses[endpoint]}
+                for endpoint in set(self.hits) | set(self.misses)}
+
+    def clear(self):
+        with self.lock:
+            with self.connection:
+                self.connection.execute('DELETE FROM cache')
+
+    def close(self):
+        self.connection.close()
+
+    def _get_ttl(self, endpoint):
+        if isinstance(self.ttl, dict):
+            return self.ttl.get(endpoint, self.ttl.get(None, 86400))
+        return self.ttl
+
+    def _evict(self):
+        if not self.max_entries:
+            return
+        entries = self.connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if entries > self.max_entries:
+            self.connection.execute('DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache '
+                                    'ORDER BY accessed LIMIT ?)', (entries - self.max_entries,))
@@ -1,16 +1,44 @@
-import requests
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from urllib import parse
 import re
+import requests
+from ..cache import ResponseCache
+from ..metrics import Metrics
+from ..transport import Transport
+
+POST_RE = re.compile(r'/(.+?)/posts/(\d+)')
+VIDEO_RE = re.compile(r'/(.+?)/videos/(\d+)')
+PHOTO_RE = re.compile(r'v=(\d+)|fbid=(\d+)')
+PERMALINK_RE = re.compile(r'story_fbid=(\d+)&')
+EVENT_RE = re.compile(r'events/(\d+)')
+FBPAGE_ID_RE = re.compile(r'fbpage_id=(\d+)')
 
 class Facebook():
 
-    def __init__(self, config):
+    def __init__(self, config, pool_size=10, max_retries=5, backoff_factor=1, cache_file='', cache_ttl=30 * 86400,
+                 metrics=None, base_url='https://graph.facebook.com/', users_info_size=10000):
         """
             Config is a dict containing: app_id; app_secret; page_access_token
+            pool_size, max_retries and backoff_factor configure the HTTP transport
+            cache_file is the name for a SQLite file in which username -> page id lookups are kept
+            for cache_ttl seconds
+            metrics is an emma_toolkit.metrics.Metrics instance, to share one between clients
+            base_url is the root of the API, e.g. emma_toolkit.mockapi.MockAPIServer.facebook_url
+            users_info_size is the number of users get_users_info keeps in memory; the least
+            recently used ones are dropped when it is exceeded
         """
+        self.metrics = metrics if metrics else Metrics()
+        self.transport = Transport(pool_size=pool_size, max_retries=max_retries, backoff_factor=backoff_factor,
+                                   metrics=self.metrics)
+        self.cache = ResponseCache(cache_file, ttl=cache_ttl) if cache_file else None
+        self.username_ids = {}
+        self.users_info = OrderedDict()
+        self.users_info_size = users_info_size
         self.app_id = config['app_id']
         self.app_secret = config['app_secret']
-        self.base_url = 'https://graph.facebook.com/'
+        self.base_url = base_url
         self.access_token = self._get_access_token()
         if 'page_access_token' in config:
             self.page_access_token = config['page_access_token']
@@ -18,30 +46,102 @@ class Facebook():
             self.page_access_token = ''
 
     def _get_access_token(self):
-        url = 'https://graph.facebook.com/v2.5/oauth/access_token?client_id={}&' \
+        url = self.base_url + 'v2.5/oauth/access_token?client_id={}&' \
               'client_secret={}&grant_type=client_credentials'.format(self.app_id, self.app_secret)
-        access_token = requests.get(url).json()['access_token']
+        access_token = self.transport.request('GET', url).json()['access_token']
         return access_token
 
-    def _request(self, url, params = {}, method='GET', access_token='user'):
+    def _request(self, url, params = None, method='GET', access_token='user'):
+        params = dict(params) if params else {}
+        params['access_token'] = self._get_token(access_token)
+        return self.transport.request(method, url, params=params)
+
+    def _get_token(self, access_token):
         if access_token == 'user':
-            params['access_token'] = self.access_token
+            return self.access_token
         elif access_token == 'page':
             if not self.page_access_token:
                 print('Geen page access token!')
                 raise Exception
-            params['access_token'] = self.page_access_token
-        if method == 'GET':
-            r = requests.get(url=url, params=params)
-        elif method == 'POST':
-            r = requests.post(url=url, params=params)
-        else:
-            raise TypeError("'Method' should be either POST or GET.")
-        return r
+            return self.page_access_token
+        raise ValueError("access_token should be either 'user' or 'page'")
+
+    def iter_pages(self, url, params = None, access_token='user'):
+        """
+        Yields the 'data' of every page of a list response, following paging.next.
+        """
+        r = self._request(url, params, access_token=access_token).json()
+        while True:
+            yield r.get('data', [])
+            next_url = r.get('paging', {}).get('next')
+            if not next_url or not r.get('data'):
+                return
+            r = self.transport.request('GET', next_url).json()
+
+    def batch(self, batch_requests, access_token='user'):
+        """
+        Sends requests with the Graph API batch parameter, 50 per HTTP request.
+
+        :param batch_requests: list of relative urls (e.g. '12345/comments?limit=100') or dicts
+                         with 'method' and 'relative_url'
+        :return: list with the decoded body of every request, in the same order;
+                 None for requests that failed
+        """
+        results = []
+        for i in range(0, len(batch_requests), 50):
+            chunk = [request if isinstance(request, dict) else {'method': 'GET', 'relative_url': request}
+                     for request in batch_requests[i:i+50]]
+            data = {'batch': json.dumps(chunk), 'include_headers': 'false',
+                    'access_token': self._get_token(access_token)}
+            responses = self.transport.request('POST', self.base_url, data=data).json()
+            if isinstance(responses, dict):
+                raise ValueError('Batch request mislukt: {}'.format(responses.get('error', responses)))
+            for response in responses:
+                if response and response.get('code') == 200:
+                    results.append(json.loads(response['body']))
+                else:
+                    results.append(None)
+        return results
 
     def _get_id_from_username(self, username):
-        html = requests.get('https://facebook.com/' + username).text
-        result = re.findall(r'fbpage_id=(\d+)', html)
+        return self._get_ids_from_usernames([username])[username]
+
+    def _get_ids_from_usernames(self, usernames, concurrency=8):
+        """
+        Looks up the page id of every username: from memory, then from the cache
+        file, and the rest by downloading their pages concurrently. Only ids that
+        were found are kept, so failed lookups are tried again next time.
+
+        :return: Dict: {username: id}, with '' for usernames whose page has no page
+                 id and None for usernames whose page could not be downloaded
+        """
+        usernames = list(dict.fromkeys(usernames))
+        ids = {username: self.username_ids[username] for username in usernames if username in self.username_ids}
+        misses = [username for username in usernames if username not in ids]
+        if misses and self.cache:
+            ids.update((username, id) for username, id in self.cache.get_many('username', misses).items() if id)
+            misses = [username for username in misses if username not in ids]
+        if misses:
+            with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(misses)))) as executor:
+                fetched = dict(zip(misses, executor.map(self._fetch_id_from_username, misses)))
+            found = {username: id for username, id in fetched.items() if id}
+            if self.cache and found:
+                self.cache.set_many('username', found)
+            ids.update(fetched)
+        self.username_ids.update((username, id) for username, id in ids.items() if id)
+        return ids
+
+    def _fetch_id_from_username(self, username):
+        # None if the page could not be downloaded, '' if it has no page id
+        try:
+            r = self.transport.request('GET', 'https://facebook.com/' + username, endpoint='facebook.com/{username}')
+        except requests.exceptions.RequestException as e:
+            self.transport.logger.error('{} bij het opzoeken van {}.'.format(type(e).__name__, username))
+            return None
+        if r.status_code != 200:
+            self.transport.logger.error('HTTP {} bij het opzoeken van {}.'.format(r.status_code, username))
+            return None
+        result = FBPAGE_ID_RE.findall(r.text)
         if result:
             id = result[0]
         else:
@@ -52,71 +152,121 @@ class Facebook():
         self.page_access_token = page_access_token
 
     def get_object_comments(self, object_id, user_info = False):
-        url = self.base_url + object_id + '/comments'
-        r = self._request(url).json()
-        if 'data' in r:
-            comments = r['data']
-        else:
-            comments = []
+        comments = []
+        for page in self.iter_object_comments(object_id):
+            comments += page
         if user_info:
+            users_info = self.get_users_info([c['from']['id'] for c in comments if 'from' in c])
             for c in comments:
-                user_info = self.get_user_info(c['from']['id'])
-                c['from']['metadata'] = user_info['metadata']
+                if 'from' in c and 'metadata' in users_info.get(c['from']['id'], {}):
+                    c['from']['metadata'] = users_info[c['from']['id']]['metadata']
         return comments
 
     def get_user_id_from_url(self, url):
+        user_id, username = self._parse_user_url(url)
+        if username:
+            user_id = self._get_id_from_username(username)
+        return user_id
+
+    def get_post_id_from_url(self, url):
+        post_id, username, post_number = self._parse_post_url(url)
+        return post_id
+
+    def resolve_urls(self, urls, id_type='user', concurrency=8):
+        """
+        Resolves many urls at once. Every distinct username is looked up only
+        once, and the lookups run concurrently.
+
+        :param urls: iterable of Facebook urls
+        :param id_type: String: ['user', 'post']
+        :return: Dict: {url: id}, with None for urls that could not be parsed. Unlike
+                 get_post_id_from_url, post urls with a username are resolved as well.
+        """
+        if id_type not in ['user', 'post']:
+            raise ValueError('Parameter "id_type" should be one of [user, post]')
+        parsed = {}
+        for url in dict.fromkeys(urls):
+            try:
+                if id_type == 'user':
+                    parsed[url] = self._parse_user_url(url) + ('',)
+                else:
+                    parsed[url] = self._parse_post_url(url)
+            except (IndexError, ValueError):
+                parsed[url] = None
+        usernames = [result[1] for result in parsed.values() if result and result[1]]
+        username_ids = self._get_ids_from_usernames(usernames, concurrency) if usernames else {}
+        ids = {}
+        for url, result in parsed.items():
+            if result is None:
+                ids[url] = None
+            elif not result[1]:
+                ids[url] = result[0]
+            elif id_type == 'user' or not username_ids[result[1]]:
+                ids[url] = username_ids[result[1]]
+            else:
+                ids[url] = username_ids[result[1]] + '_' + result[2]
+        return ids
+
+    def _parse_user_url(self, url):
+        """
+        :return: (user_id, username); username is set if it still has to be looked up
+        """
         parsed_url = parse.urlparse(url)
         path = parsed_url.path
         query = parsed_url.query
+        username = ''
         try:
             if 'post' in path:
-                user_id = re.findall(r'/(.+?)/posts/\d+', path)[0]
-                try:
-                    int(user_id)
-                except ValueError:
-                    user_id = self._get_id_from_username(user_id)
+                user_id = POST_RE.findall(path)[0][0]
+                if not user_id.isdigit():
+                    user_id, username = '', user_id
             elif 'video' in path:
-                user_id = re.findall(r'/(.+?)/videos/\d+', path)[0]
+                user_id = VIDEO_RE.findall(path)[0][0]
             elif 'photo' in path:
-                result = re.findall(r'v=(\d+)|fbid=(\d+)', query)[0]
+                result = PHOTO_RE.findall(query)[0]
                 user_id = result[0] if result[0] else result[1]
             elif 'permalink' in path:
-                user_id = re.findall(r'story_fbid=(\d+)&', query)[0]
+                user_id = PERMALINK_RE.findall(query)[0]
             elif 'events' in path:
-                user_id = re.findall(r'events/(\d+)', path)[0]
+                user_id = EVENT_RE.findall(path)[0]
             else:
                 raise ValueError('URL nog niet in systeem: {}'.format(url))
         except IndexError:
             raise IndexError('URL nog niet in systeem: {}'.format(url))
-        return user_id
+        return user_id, username
 
-    def get_post_id_from_url(self, url):
+    def _parse_post_url(self, url):
+        """
+        :return: (post_id, username, post_number); for posts of a username post_id is
+                 empty and username and post_number are set
+        """
         parsed_url = parse.urlparse(url)
         path = parsed_url.path
         query = parsed_url.query
+        username = ''
+        post_number = ''
         try:
             if 'post' in path:
-                post_ids = re.findall(r'/(.+?)/posts/(\d+)', path)
-                try:
-                    int(post_ids[0][0])
+                post_ids = POST_RE.findall(path)
+                if post_ids[0][0].isdigit():
                     post_id = str(post_ids[0][0]) + '_' + str(post_ids[0][1])
-                except ValueError:
-                    post_id = ''
+                else:
+                    post_id, username, post_number = '', post_ids[0][0], post_ids[0][1]
             elif 'video' in path:
-                post_ids = re.findall(r'/(.+?)/videos/(\d+)', path)
+                post_ids = VIDEO_RE.findall(path)
                 post_id = str(post_ids[0][0]) + '_' + str(post_ids[0][1])
             elif 'photo' in path:
-                post_ids = re.findall(r'v=(\d+)|fbid=(\d+)', query)
+                post_ids = PHOTO_RE.findall(query)
                 post_id = str(post_ids[0][0]) + '_' + str(post_ids[0][1])
             elif 'permalink' in path:
-                post_id = re.findall(r'story_fbid=(\d+)&', query)[0]
+                post_id = PERMALINK_RE.findall(query)[0]
             elif 'events' in path:
-                post_id = re.findall(r'events/(\d+)', path)[0]
+                post_id = EVENT_RE.findall(path)[0]
             else:
                 raise ValueError('URL nog niet in systeem: {}'.format(url))
         except IndexError:
             raise IndexError('URL nog niet in systeem: {}'.format(url))
-        return post_id
+        return post_id, username, post_number
 
     # TODO foutmelding: 'Unsupported get request. Object with ID 317412078342460 does not exist' --> Ondervangen
 
@@ -127,16 +277,30 @@ class Facebook():
         return r
 
     def get_long_lived_page_access_token(self, page_access_token):
-        url = 'https://graph.facebook.com/oauth/access_token?client_id={}&client_secret={}&grant_type=' \
+        url = self.base_url + 'oauth/access_token?client_id={}&client_secret={}&grant_type=' \
               'fb_exchange_token&fb_exchange_token={}'.format(self.app_id, self.app_secret, page_access_token)
         r = self._request(url)
         return r
 
+    def iter_object_comments(self, object_id, params = None):
+        """
+        Yields the comments of an object page by page.
+        """
+        url = self.base_url + str(object_id) + '/comments'
+        return self.iter_pages(url, params)
+
     def get_page_feed(self, page_id):
         url = self.base_url + str(page_id) + '/feed'
         r = self._request(url, access_token='page')
         return r
 
+    def iter_page_feed(self, page_id, params = None):
+        """
+        Yields the posts of a page feed page by page, following paging.next.
+        """
+        url = self.base_url + str(page_id) + '/feed'
+        return self.iter_pages(url, params, access_token='page')
+
     def get_object_insights(self, object_id, metrics):
         url = self.base_url + str(object_id) + '/insights'
         params = {'metric': ','.join(metrics), 'period': 'days_28'}
@@ -148,6 +312,41 @@ class Facebook():
         r = self._request(url, params = {'metadata': 1}).json()
         return r
 
+    def get_users_info(self, user_ids):
+        """
+        Fetches the info of many users with multi-id requests (?ids=a,b,c), 50 ids
+        per request. The info of the last users_info_size users is kept on the
+        instance, so users seen recently cost no further requests; errors are
+        returned but not kept, so those users are requested again next time.
+
+        :param user_ids: iterable of user ids
+        :return: Dict: {user_id: info}
+        """
+        user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+        users_info = {}
+        for user_id in user_ids:
+            if user_id in self.users_info:
+                self.users_info.move_to_end(user_id)
+                users_info[user_id] = self.users_info[user_id]
+        misses = [user_id for user_id in user_ids if user_id not in users_info]
+        for i in range(0, len(misses), 50):
+            chunk = misses[i:i+50]
+            r = self._request(self.base_url, params = {'ids': ','.join(chunk), 'metadata': 1}).json()
+            if 'error' in r:
+                # One unknown id fails the whole request, so fall back to single requests
+                r = {user_id: self.get_user_info(user_id) for user_id in chunk}
+            for user_id, info in r.items():
+                users_info[user_id] = info
+                if 'error' not in info:
+                    self._keep_user_info(user_id, info)
+        return {user_id: users_info[user_id] for user_id in user_ids if user_id in users_info}
+
+    def _keep_user_info(self, user_id, info):
+        self.users_info[user_id] = info
+        self.users_info.move_to_end(user_id)
+        while len(self.users_info) > self.users_info_size:
+            self.users_info.popitem(last=False)
+
     def search(self, query, type):
         url = self.base_url + 'search'
         params = {'q': query, 'type': type}
@@ -1 +1,6 @@
-from parse_geonames_file import parse_geonames_file
\ No newline at end of file
+from .parse_geonames_file import parse_geonames_file
+from .load_geonames import load_geonames
+from .get_place_admin_divisions import build_place_index, get_place, get_places
+from .scan_places import PlaceScanner
+from .geoparse_parallel import benchmark_geoparse, geoparse_bios
+from .reverse_geocode import ReverseGeocoder
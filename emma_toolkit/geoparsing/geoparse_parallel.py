@@ -0,0 +1,107 @@
+import itertools
+import multiprocessing
+import time
+import pandas as pd
+from .get_place_admin_divisions import PLACE_COLUMNS, build_place_index
+from .scan_places import PlaceScanner
+
+# Gazetteer of the worker processes. It is set before the pool is started, so
+# forked workers share the parent's copy instead of each unpickling their own.
+_gazetteer = None
+
+
+def geoparse_bios(bios, geonames, method='exact', column=None, processes=None, chunksize=10000, **scanner_options):
+    """
+    :param bios: Pandas Series, Pandas DataFrame (with column) or iterable of strings
+    :param geonames: the geonames table, or a prebuilt place index (method='exact')
+                     or PlaceScanner (method='scan')
+    :param method: String: ['exact', 'scan']. 'exact' matches whole bios like get_places,
+                   'scan' finds every place mention like PlaceScanner.find_places_in_bios
+    :param processes: number of worker processes, defaults to the number of cores
+    :param chunksize: number of bios sent to a worker at a time
+    :return: Pandas DataFrame in input order. For 'exact' it has the index of bios,
+             for 'scan' a RangeIndex and the column 'bio' refers to that index.
+    """
+    global _gazetteer
+    if isinstance(bios, pd.DataFrame):
+        if column is None:
+            raise ValueError("Parameter 'column' is required when bios is a DataFrame")
+        bios = bios[column]
+    _gazetteer = _build_gazetteer(geonames, method, scanner_options)
+    chunks = _create_chunks(bios, chunksize)
+    processes = processes or multiprocessing.cpu_count()
+    try:
+        if processes == 1:
+            results = [_geoparse_chunk(chunk) for chunk in chunks]
+        elif 'fork' in multiprocessing.get_all_start_methods():
+            with multiprocessing.get_context('fork').Pool(processes) as pool:
+                results = list(pool.imap(_geoparse_chunk, chunks))
+        else:
+            with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(_gazetteer,)) as pool:
+                results = list(pool.imap(_geoparse_chunk, chunks))
+        if not results:
+            results = [_geoparse_chunk(pd.Series([], dtype=object))]
+    finally:
+        _gazetteer = None
+    # The mentions of every chunk are numbered from 0, the exact matches keep the index of bios
+    return pd.concat(results, ignore_index=(method == 'scan'))
+
+
+def benchmark_geoparse(bios, geonames, workers=(1, 2, 4, 8), method='exact', chunksize=10000, **scanner_options):
+    """
+    Times geoparse_bios on the same bios for every number of workers. The gazetteer
+    is built once beforehand, so only the geoparsing itself is measured.
+
+    :return: Pandas DataFrame with seconds, bios per second and speedup per number of workers
+    """
+    bios = pd.Series(list(bios))
+    gazetteer = _build_gazetteer(geonames, method, scanner_options)
+    timings = []
+    for processes in workers:
+        start = time.perf_counter()
+        geoparse_bios(bios, gazetteer, method=method, processes=processes, chunksize=chunksize)
+        seconds = time.perf_counter() - start
+        timings.append({'workers': processes, 'seconds': seconds, 'bios_per_second': len(bios) / seconds})
+    timings = pd.DataFrame(timings).set_index('workers')
+    timings['speedup'] = timings['bios_per_second'] / timings['bios_per_second'].iloc[0]
+    return timings
+
+
+def _build_gazetteer(geonames, method, scanner_options):
+    if method == 'exact':
+        if isinstance(geonames, pd.DataFrame) and geonames.index.name == 'place':
+            return geonames[PLACE_COLUMNS]
+        return build_place_index(geonames)[PLACE_COLUMNS]
+    elif method == 'scan':
+        if isinstance(geonames, PlaceScanner):
+            return geonames
+        return PlaceScanner(geonames, **scanner_options)
+    raise ValueError('Parameter "method" should be one of [exact, scan]')
+
+
+def _create_chunks(bios, chunksize):
+    if isinstance(bios, pd.Series):
+        for i in range(0, len(bios), chunksize):
+            yield bios.iloc[i:i+chunksize]
+        return
+    bios = iter(bios)
+    offset = 0
+    while True:
+        chunk = list(itertools.islice(bios, chunksize))
+        if not chunk:
+            return
+        yield pd.Series(chunk, index=range(offset, offset + len(chunk)), dtype=object)
+        offset += len(chunk)
+
+
+def _init_worker(gazetteer):
+    global _gazetteer
+    _gazetteer = gazetteer
+
+
+def _geoparse_chunk(bios):
+    if isinstance(_gazetteer, PlaceScanner):
+        return _gazetteer.find_places_in_bios(bios)
+    places = _gazetteer.reindex(bios.values)
+    places.index = bios.index
+    return places
@@ -1,5 +1,51 @@
 import pandas as pd
 
+PLACE_COLUMNS = ['name', 'adm1', 'adm2', 'adm3', 'adm4']
+
+
+def build_place_index(geonames, min_population=0, feature_classes=None):
+    """
+    Builds a lookup table from every name and alternate name in geonames to its
+    best candidate: the place with the highest population. ADM names are resolved
+    up front, so lookups in the index need no further access to geonames.
+
+    :param geonames: Pandas DataFrame, see parse_geonames_file
+    :param min_population: skip places with a smaller population
+    :param feature_classes: only include these feature classes, e.g. ['P', 'A']
+    :return: Pandas DataFrame indexed by 'place', to be passed to get_place or get_places
+    """
+    candidates = geonames
+    if min_population:
+        candidates = candidates[candidates['pop'] >= min_population]
+    if feature_classes:
+        candidates = candidates[candidates['feature_class'].isin(feature_classes)]
+    names = pd.concat([candidates['name'], candidates['alternate_names'].explode()])
+    names = names[names.notnull() & (names != '')]
+    index = pd.DataFrame({'place': names.values, 'geonameid': names.index.values})
+    index['pop'] = candidates['pop'].reindex(index['geonameid']).values
+    index = index.sort_values('pop', ascending=False, kind='mergesort').drop_duplicates('place')
+    places = candidates.loc[index['geonameid']]
+    admin_names = get_admin_names(places, geonames)
+    index = index.set_index('place')
+    for column in PLACE_COLUMNS:
+        index[column] = admin_names[column].values
+    index['feature_class'] = places['feature_class'].values
+    return index[PLACE_COLUMNS + ['geonameid', 'pop', 'feature_class']]
+
+
+def get_admin_names(places, geonames):
+    """
+    :param places: rows of geonames
+    :param geonames: Pandas DataFrame, see parse_geonames_file
+    :return: Pandas DataFrame with the name and adm1 - adm4 of every place
+    """
+    admin_names = pd.DataFrame({'name': places['name'], 'adm1': places['ADM1']}, index=places.index)
+    for admin_level in ['ADM2', 'ADM3', 'ADM4']:
+        names = geonames['name'].reindex(places[admin_level].fillna(-1).astype('int64'))
+        admin_names[admin_level.lower()] = names.fillna('').values
+    return admin_names
+
+
 def get_place(place_in_bio, geonames):
     def try_geoname(place):
         try:
@@ -12,6 +58,11 @@ def get_place(place_in_bio, geonames):
             return place_geoname
         except IndexError:
             return pd.Series()
+    if geonames.index.name == 'place':
+        try:
+            return geonames.loc[place_in_bio, PLACE_COLUMNS].to_dict()
+        except KeyError:
+            return None
     place_geoname = try_geoname(place_in_bio)
     if place_geoname.empty:
         return None
@@ -26,4 +77,16 @@ def get_place(place_in_bio, geonames):
         'adm2': adm2,
         'adm3': adm3,
         'adm4': adm4
-    }
\ No newline at end of file
+    }
+
+
+def get_places(places_in_bios, geonames):
+    """
+    :param places_in_bios: iterable of strings
+    :param geonames: place index from build_place_index, or the geonames table itself
+    :return: Pandas DataFrame with name and adm1 - adm4 per input string, in input
+             order and indexed by that string. Unknown places are NaN.
+    """
+    if geonames.index.name != 'place':
+        geonames = build_place_index(geonames)
+    return geonames[PLACE_COLUMNS].reindex(list(places_in_bios))
@@ -0,0 +1,78 @@
+import glob
+import hashlib
+import os
+import pandas as pd
+from .parse_geonames_file import parse_geonames_file
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Bump when the output of parse_geonames_file changes, so existing caches are rebuilt
+CACHE_VERSION = 2
+
+
+def load_geonames(input, cache_dir=None, chunksize=500000):
+    """
+    Returns the parsed geonames table of input, read from a compiled Arrow cache.
+    The cache is keyed by the path, size and mtime of input and is rebuilt only
+    when input changes. It is read through a memory map into Arrow-backed columns
+    (pd.ArrowDtype) without copying, so a warm load is fast and processes loading
+    the same cache share its pages. After a rebuild the table is read back from
+    the cache too, so the column types do not depend on the state of the cache.
+
+    :param input: path to a geonames dump
+    :param cache_dir: directory for the cache file, defaults to the directory of input
+    :param chunksize: passed on to parse_geonames_file when the cache is rebuilt
+    :return: Pandas DataFrame, see parse_geonames_file, with Arrow-backed columns
+    """
+    if pa is None:
+        raise ImportError("load_geonames requires pyarrow, install it with 'pip install pyarrow'")
+    cache_file = _cache_file(input, cache_dir)
+    if not os.path.exists(cache_file):
+        geonames = parse_geonames_file(input, chunksize=chunksize)
+        _write_cache(geonames, cache_file)
+        del geonames
+        _remove_stale_caches(input, cache_file, cache_dir)
+    return _read_cache(cache_file)
+
+
+def _cache_file(input, cache_dir):
+    path = os.path.abspath(input)
+    stat = os.stat(path)
+    key = '{}:{}:{}:{}'.format(CACHE_VERSION, path, stat.st_size, stat.st_mtime_ns)
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(_cache_prefix(input, cache_dir) + '.{}.arrow'.format(digest))
+
+
+def _cache_prefix(input, cache_dir):
+    # The hash of the path keeps sources with the same name in one cache_dir apart
+    path = os.path.abspath(input)
+    path_digest = hashlib.sha1(path.encode('utf-8')).hexdigest()[:8]
+    if cache_dir is None:
+        cache_dir = os.path.dirname(path)
+    return os.path.join(cache_dir, '{}.{}'.format(os.path.basename(path), path_digest))
+
+
+def _write_cache(geonames, cache_file):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    table = pa.Table.from_pandas(geonames)
+    temp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+    with pa.OSFile(temp_file, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temp_file, cache_file)
+
+
+def _read_cache(cache_file):
+    with pa.memory_map(cache_file, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def _remove_stale_caches(input, cache_file, cache_dir):
+    pattern = glob.escape(_cache_prefix(input, cache_dir)) + '.*.arrow'
+    for stale_file in glob.glob(pattern):
+        if stale_file != cache_file:
+            os.remove(stale_file)
@@ -1,47 +1,57 @@
-def parse_geonames_file(input):
-    def get_feature_codes(code, admin_level):
-        if not code:
-            return ''
-        row = geonames[(geonames[admin_level] == code) & (geonames['feature_code'] == admin_level)]
-        if len(row) == 0:
-            return ''
-        name = row.index.tolist()[0]
-        return name
+import csv
+import pandas as pd
 
-    geonames = {}
-    with open(input, encoding='utf-8') as f:
-        entries = f.read().split('\n')
-        for entry in entries:
-            split_entry = entry.split('\t')
-            if len(split_entry) == 1:
-                continue
-            id = split_entry[0]
-            name = split_entry[1]
-            alternate_names = split_entry[3].split(',')
-            lat = split_entry[4]
-            long = split_entry[5]
-            feature_class = split_entry[6]
-            feature_code = split_entry[7]
-            adm1 = split_entry[10]
-            adm2 = split_entry[11]
-            adm3 = split_entry[12]
-            adm4 = split_entry[13]
-            pop = split_entry[14]
-            geonames[id] = {
-                'name': name,
-                'alternate_names': alternate_names,
-                'lat': lat,
-                'long': long,
-                'feature_class': feature_class,
-                'feature_code': feature_code,
-                'ADM1': adm1,
-                'ADM2': adm2,
-                'ADM3': adm3,
-                'ADM4': adm4,
-                'pop': pop
-            }
-        geonames = pd.DataFrame.from_dict(data = geonames, orient = 'index')
-        geonames['ADM2'] = geonames['ADM2'].apply(lambda x: get_feature_codes(x, 'ADM2'))
-        geonames['ADM3'] = geonames['ADM3'].apply(lambda x: get_feature_codes(x, 'ADM3'))
-        geonames['ADM4'] = geonames['ADM4'].apply(lambda x: get_feature_codes(x, 'ADM4'))
-        return geonames
\ No newline at end of file
+GEONAMES_COLUMNS = ['geonameid', 'name', 'asciiname', 'alternate_names', 'lat', 'long', 'feature_class',
+                    'feature_code', 'country_code', 'cc2', 'ADM1', 'ADM2', 'ADM3', 'ADM4', 'pop', 'elevation',
+                    'dem', 'timezone', 'modification_date']
+USED_COLUMNS = ['geonameid', 'name', 'alternate_names', 'lat', 'long', 'feature_class', 'feature_code',
+                'country_code', 'ADM1', 'ADM2', 'ADM3', 'ADM4', 'pop']
+ADMIN_LEVELS = ['ADM2', 'ADM3', 'ADM4']
+
+
+def parse_geonames_file(input, chunksize=500000):
+    """
+    :param input: path to a geonames dump (e.g. allCountries.txt or NL.txt)
+    :param chunksize: number of rows parsed at a time
+    :return: Pandas DataFrame indexed by geonameid. ADM2, ADM3 and ADM4 hold the
+             geonameid of the matching admin division (NaN if there is none).
+    """
+    reader = pd.read_csv(input, sep='\t', header=None, names=GEONAMES_COLUMNS, usecols=USED_COLUMNS,
+                         dtype=str, keep_default_na=False, quoting=csv.QUOTE_NONE, encoding='utf-8',
+                         index_col=False, chunksize=chunksize)
+    chunks = [_clean_chunk(chunk) for chunk in reader]
+    if chunks:
+        geonames = pd.concat(chunks)
+    else:
+        geonames = _clean_chunk(pd.DataFrame(columns=USED_COLUMNS, dtype=str))
+    resolved = _resolve_admin_divisions(geonames)
+    for admin_level in ADMIN_LEVELS:
+        geonames[admin_level] = resolved[admin_level]
+    return geonames.set_index('geonameid')
+
+
+def _clean_chunk(chunk):
+    chunk = chunk[USED_COLUMNS].copy()
+    chunk['geonameid'] = chunk['geonameid'].astype('int64')
+    chunk['alternate_names'] = chunk['alternate_names'].str.split(',')
+    chunk['lat'] = pd.to_numeric(chunk['lat'], errors='coerce')
+    chunk['long'] = pd.to_numeric(chunk['long'], errors='coerce')
+    chunk['pop'] = pd.to_numeric(chunk['pop'], errors='coerce').fillna(0).astype('int64')
+    return chunk
+
+
+def _resolve_admin_divisions(geonames):
+    """
+    Looks up the geonameid of the ADM2, ADM3 and ADM4 division of every row with
+    one merge per admin level, keyed on the country and admin code hierarchy.
+    """
+    resolved = {}
+    for depth, admin_level in enumerate(ADMIN_LEVELS, start=2):
+        keys = ['country_code'] + ['ADM{}'.format(level) for level in range(1, depth + 1)]
+        divisions = geonames.loc[(geonames['feature_code'] == admin_level) & (geonames[admin_level] != ''),
+                                 keys + ['geonameid']]
+        divisions = divisions.drop_duplicates(keys)
+        matches = geonames[keys].merge(divisions, how='left', on=keys)['geonameid']
+        matches.index = geonames.index
+        resolved[admin_level] = matches.where(geonames[admin_level] != '')
+    return resolved
@@ -0,0 +1,61 @@
+import numpy as np
+from .get_place_admin_divisions import PLACE_COLUMNS, get_admin_names
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+class ReverseGeocoder():
+
+    def __init__(self, geonames, feature_classes=('P',), min_population=0):
+        """
+        Builds a KD-tree over the coordinates of the places in geonames, to map
+        coordinates (e.g. of tweets) to the nearest place and its admin divisions.
+
+        geonames is the table from parse_geonames_file or load_geonames
+        feature_classes and min_population limit which places can be returned
+        """
+        if cKDTree is None:
+            raise ImportError("ReverseGeocoder requires scipy, install it with 'pip install scipy'")
+        places = geonames[geonames['lat'].notnull() & geonames['long'].notnull()]
+        if feature_classes:
+            places = places[places['feature_class'].isin(feature_classes)]
+        if min_population:
+            places = places[places['pop'] >= min_population]
+        if len(places) == 0:
+            raise ValueError('No places with coordinates left to build the index from')
+        self.places = get_admin_names(places, geonames)
+        self.places['geonameid'] = places.index.values
+        self.tree = cKDTree(self._to_xyz(places['lat'].values, places['long'].values))
+
+    def lookup(self, lats, lons, workers=-1):
+        """
+        :param lats: array-like of latitudes
+        :param lons: array-like of longitudes, same length as lats
+        :param workers: number of threads used by the KD-tree, -1 uses all cores
+        :return: Pandas DataFrame with name, adm1 - adm4, geonameid and distance_km of
+                 the nearest place, one row per coordinate; NaN for coordinates that
+                 are missing or not finite
+        """
+        lats = np.asarray(lats, dtype='float64')
+        lons = np.asarray(lons, dtype='float64')
+        if lats.shape != lons.shape:
+            raise ValueError('lats and lons should have the same length')
+        finite = np.isfinite(lats) & np.isfinite(lons)
+        chord, nearest = self.tree.query(self._to_xyz(lats[finite], lons[finite]), k=1, workers=workers)
+        result = self.places.iloc[nearest][PLACE_COLUMNS + ['geonameid']]
+        result.index = np.flatnonzero(finite)
+        result['distance_km'] = 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+        if finite.all():
+            return result
+        return result.reindex(range(len(lats)))
+
+    def _to_xyz(self, lats, lons):
+        lats = np.radians(lats)
+        lons = np.radians(lons)
+        cos_lats = np.cos(lats)
+        return np.column_stack((cos_lats * np.cos(lons), cos_lats * np.sin(lons), np.sin(lats)))
@@ -0,0 +1,159 @@
+from collections import deque
+import numpy as np
+import pandas as pd
+from .get_place_admin_divisions import PLACE_COLUMNS, build_place_index
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+class PlaceScanner():
+
+    def __init__(self, geonames, min_population=0, feature_classes=None, case_sensitive=False, min_length=3):
+        """
+        Compiles every name and alternate name in geonames into one Aho-Corasick
+        automaton, so all place mentions in a text are found in a single pass.
+
+        geonames is the table from parse_geonames_file or load_geonames
+        min_population and feature_classes limit which places can be found
+        min_length is the shortest name that is matched
+
+        The place rows take about 100 bytes per name. The automaton has one node
+        for every character a name does not share with a name added before: about
+        40 bytes per node with pyahocorasick, which is used if it is installed
+        ('pip install pyahocorasick'), and a few hundred bytes per node (a dict and
+        three list items) with the pure-Python fallback, which also takes about
+        twice as long to build. On platforms that do not fork, geoparse_bios pickles
+        the scanner into every worker, so this memory is needed once per worker.
+        """
+        self.case_sensitive = case_sensitive
+        index = build_place_index(geonames, min_population=min_population, feature_classes=feature_classes)
+        index = index.sort_values('pop', ascending=False, kind='mergesort')
+        # Place rows are kept as one object array per column, in which repeated
+        # names (e.g. of admin divisions) share one string
+        self._columns = []
+        for column in PLACE_COLUMNS:
+            codes, uniques = pd.factorize(index[column], use_na_sentinel=False)
+            self._columns.append(np.asarray(uniques, dtype=object)[codes])
+        self._lengths = index.index.str.len().tolist()
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton(ahocorasick.STORE_INTS)
+        else:
+            self._automaton = None
+            self._goto = [{}]
+            self._fail = [0]
+            self._output = [-1]
+            self._dict_link = [0]
+        for place_id, place in enumerate(index.index.to_numpy(dtype=object)):
+            pattern = place if case_sensitive else self._lower(place)
+            if len(pattern) >= min_length:
+                self._add_pattern(pattern, place_id)
+        if self._automaton is not None:
+            self._automaton.make_automaton()
+        else:
+            self._build_links()
+
+    def find_places(self, text, overlapping=False):
+        """
+        :param text: String, e.g. a Twitter bio
+        :param overlapping: if False, only the longest of overlapping mentions is kept
+        :return: list of dicts with the matched text, its start and end, and the place
+        """
+        if not isinstance(text, str):
+            return []
+        haystack = text if self.case_sensitive else self._lower(text)
+        matches = []
+        for end, place_id in self._iter_matches(haystack):
+            start = end - self._lengths[place_id]
+            if self._is_boundary(haystack, start - 1) and self._is_boundary(haystack, end):
+                matches.append((start, end, place_id))
+        matches.sort(key=lambda match: (match[0], match[0] - match[1]))
+        if not overlapping:
+            matches = self._remove_overlaps(matches)
+        return [dict(zip(PLACE_COLUMNS, [column[place_id] for column in self._columns]),
+                     match=text[start:end], start=start, end=end) for start, end, place_id in matches]
+
+    def find_places_in_bios(self, bios, overlapping=False):
+        """
+        :param bios: iterable of strings, or a Pandas Series
+        :return: Pandas DataFrame with one row per mention; 'bio' holds the index of the bio
+        """
+        if not isinstance(bios, pd.Series):
+            bios = pd.Series(list(bios))
+        mentions = []
+        for bio_index, bio in bios.items():
+            for mention in self.find_places(bio, overlapping=overlapping):
+                mention['bio'] = bio_index
+                mentions.append(mention)
+        return pd.DataFrame(mentions, columns=['bio', 'match', 'start', 'end'] + PLACE_COLUMNS)
+
+    def _iter_matches(self, haystack):
+        # Yields (end, place_id) of every pattern in haystack, overlapping ones included
+        if self._automaton is not None:
+            if len(self._automaton):
+                for last, place_id in self._automaton.iter(haystack):
+                    yield last + 1, place_id
+            return
+        goto, fail, output, dict_link = self._goto, self._fail, self._output, self._dict_link
+        state = 0
+        for end, char in enumerate(haystack, start=1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            node = state if output[state] >= 0 else dict_link[state]
+            while node:
+                yield end, output[node]
+                node = dict_link[node]
+
+    def _add_pattern(self, pattern, place_id):
+        # A pattern added before belongs to a place with a larger population
+        if self._automaton is not None:
+            if pattern not in self._automaton:
+                self._automaton.add_word(pattern, place_id)
+            return
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(-1)
+                self._dict_link.append(0)
+            state = next_state
+        if self._output[state] < 0:
+            self._output[state] = place_id
+
+    def _build_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail
+                self._dict_link[next_state] = fail if self._output[fail] >= 0 else self._dict_link[fail]
+                queue.append(next_state)
+
+    def _is_boundary(self, text, position):
+        return position < 0 or position >= len(text) or not text[position].isalnum()
+
+    def _lower(self, text):
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            lowered = ''.join(char.lower() if len(char.lower()) == 1 else char for char in text)
+        return lowered
+
+    def _remove_overlaps(self, matches):
+        kept = []
+        last_end = 0
+        for start, end, place in matches:
+            if start >= last_end:
+                kept.append((start, end, place))
+                last_end = end
+        return kept
@@ -0,0 +1,113 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float('inf')]
+
+
+class Metrics():
+
+    def __init__(self):
+        """
+        Per-endpoint counters of the API clients: requests, latency histogram,
+        bytes received, retries and their backoff delays, JSON decoding time, rate
+        limit sleeps and the last known remaining quota.
+
+        Hooks added with add_hook are called as hook(event, endpoint, data) for
+        every event, with event one of 'request', 'retry', 'decode', 'sleep' or 'quota'.
+        """
+        self.started = time.time()
+        self.endpoints = defaultdict(self._new_endpoint)
+        self.hooks = []
+        self.lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def record_request(self, endpoint, latency, bytes_received, status_code):
+        with self.lock:
+            stats = self.endpoints[endpoint]
+            stats['requests'] += 1
+            stats['errors'] += int(status_code >= 400)
+            stats['network_time'] += latency
+            stats['bytes_received'] += bytes_received
+            stats['latency_histogram'][bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self._call_hooks('request', endpoint, {'latency': latency, 'bytes_received': bytes_received,
+                                               'status_code': status_code})
+
+    def record_retry(self, endpoint, reason, delay=0.0):
+        """
+        :param delay: seconds slept before the retry (backoff)
+        """
+        with self.lock:
+            self.endpoints[endpoint]['retries'] += 1
+            self.endpoints[endpoint]['backoff_time'] += delay
+        self._call_hooks('retry', endpoint, {'reason': reason, 'delay': delay})
+
+    def record_decode(self, endpoint, seconds):
+        with self.lock:
+            self.endpoints[endpoint]['decode_time'] += seconds
+        self._call_hooks('decode', endpoint, {'seconds': seconds})
+
+    def record_sleep(self, endpoint, seconds):
+        with self.lock:
+            self.endpoints[endpoint]['sleep_time'] += seconds
+            self.endpoints[endpoint]['sleeps'] += 1
+        self._call_hooks('sleep', endpoint, {'seconds': seconds})
+
+    def record_quota(self, endpoint, remaining):
+        with self.lock:
+            self.endpoints[endpoint]['remaining'] = remaining
+        self._call_hooks('quota', endpoint, {'remaining': remaining})
+
+    def summary(self):
+        """
+        :return: Dict: {endpoints: {endpoint: stats}, totals: {...}}. In the totals,
+                 other_time is the wall time not spent on the network, on decoding
+                 or asleep (rate limits and backoff): time spent in the calling code.
+        """
+        with self.lock:
+            endpoints = {endpoint: dict(stats, latency_histogram=dict(zip(LATENCY_BUCKETS,
+                                                                          stats['latency_histogram'])))
+                         for endpoint, stats in self.endpoints.items()}
+        totals = {key: sum(stats[key] for stats in endpoints.values())
+                  for key in ['requests', 'errors', 'retries', 'bytes_received', 'network_time', 'decode_time',
+                              'sleep_time', 'backoff_time']}
+        totals['wall_time'] = time.time() - self.started
+        totals['other_time'] = max(0, totals['wall_time'] - totals['network_time'] - totals['decode_time'] -
+                                   totals['sleep_time'] - totals['backoff_time'])
+        return {'endpoints': endpoints, 'totals': totals}
+
+    def report(self):
+        """
+        :return: String with one line per endpoint and the totals
+        """
+        summary = self.summary()
+        lines = ['{:<35} {:>8} {:>6} {:>7} {:>10} {:>9} {:>9} {:>9} {:>9}'.format(
+            'endpoint', 'requests', 'errors', 'retries', 'MB', 'net (s)', 'json (s)', 'sleep (s)', 'remaining')]
+        for endpoint, stats in sorted(summary['endpoints'].items()):
+            lines.append('{:<35} {:>8} {:>6} {:>7} {:>10.2f} {:>9.1f} {:>9.1f} {:>9.1f} {:>9}'.format(
+                endpoint, stats['requests'], stats['errors'], stats['retries'], stats['bytes_received'] / 1e6,
+                stats['network_time'], stats['decode_time'], stats['sleep_time'],
+                '' if stats['remaining'] is None else stats['remaining']))
+        totals = summary['totals']
+        lines.append('Totaal: {:.1f} s, waarvan netwerk {:.1f} s, json {:.1f} s, rate limits {:.1f} s, '
+                     'backoff {:.1f} s, overig {:.1f} s'.format(totals['wall_time'], totals['network_time'],
+                                                                totals['decode_time'], totals['sleep_time'],
+                                                                totals['backoff_time'], totals['other_time']))
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.endpoints.clear()
+
+    def _call_hooks(self, event, endpoint, data):
+        for hook in self.hooks:
+            hook(event, endpoint, data)
+
+    def _new_endpoint(self):
+        return {'requests': 0, 'errors': 0, 'retries': 0, 'bytes_received': 0, 'network_time': 0.0,
+                'decode_time': 0.0, 'sleep_time': 0.0, 'sleeps': 0, 'backoff_time': 0.0, 'remaining': None,
+                'latency_histogram': [0] * len(LATENCY_BUCKETS)}
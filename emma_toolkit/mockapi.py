@@ -0,0 +1,361 @@
+import datetime
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib import parse
+
+TWITTER_RATE_LIMITS = {'/followers/ids': 15,
+                       '/friends/ids': 15,
+                       '/users/lookup': 900,
+                       '/statuses/user_timeline': 900,
+                       '/application/rate_limit_status': 180}
+TWEETS_START = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+OAUTH_TOKEN_RE = re.compile(r'oauth_token="([^"]*)"')
+GRAPH_VERSION_RE = re.compile(r'^/v\d+\.\d+')
+GRAPH_EDGES = ('comments', 'feed', 'insights', 'search', 'oauth', 'access_token')
+
+
+class MockAPIServer():
+
+    def __init__(self, users=1000, mean_followers=500, id_space=None, tweets_per_user=400,
+                 comments_per_object=100, latency=0, page_size=5000, timeline_page_size=200,
+                 graph_page_size=100, rate_limits=None, window=900, failure_rate=0, seed=0,
+                 host='127.0.0.1', port=0):
+        """
+        Local stand-in for the Twitter v1.1 and Facebook Graph API endpoints the
+        clients use, serving a synthetic network that is generated on the fly.
+        Point a client at it with Twitter(config, base_url=server.twitter_url) or
+        Facebook(config, base_url=server.facebook_url).
+
+        users is the number of users with a profile, with ids 1 to users and
+        screen names user1, user2, ...
+        mean_followers is the mean of the (Pareto distributed) follower counts
+        id_space is the number of ids followers are drawn from, users * 10 by
+        default: about a tenth of the followers of a user are part of the network
+        latency is the number of seconds every response is delayed
+        page_size, timeline_page_size and graph_page_size are the maximum number
+        of items per page of the cursored, timeline and Graph endpoints
+        rate_limits is a dict {resource: calls per window} per access token,
+        defaults to TWITTER_RATE_LIMITS; window is its length in seconds
+        failure_rate is the fraction of requests answered with a 503
+        """
+        self.users = users
+        self.id_space = id_space if id_space else users * 10
+        self.tweets_per_user = tweets_per_user
+        self.comments_per_object = comments_per_object
+        self.latency = latency
+        self.page_size = page_size
+        self.timeline_page_size = timeline_page_size
+        self.graph_page_size = graph_page_size
+        self.rate_limits = dict(TWITTER_RATE_LIMITS, **(rate_limits or {}))
+        self.window = window
+        self.failure_rate = failure_rate
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.followers_counts = [0] + [self._draw_count(seed, user, mean_followers) for user in range(1, users + 1)]
+        self.friends_counts = [0] + [self._draw_count(seed + 1, user, mean_followers) for user in range(1, users + 1)]
+        self.quota = {}
+        self.server = _ThreadingHTTPServer((host, port), _Handler)
+        self.server.api = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    @property
+    def twitter_url(self):
+        return self.url + '/1.1'
+
+    @property
+    def facebook_url(self):
+        return self.url + '/'
+
+    def start(self):
+        """
+        Serves in a daemon thread, until stop is called.
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def handle(self, method, path, params, headers):
+        """
+        :return: (status code, headers, body) of the response
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        if path.startswith('/1.1/'):
+            resource = re.sub(r'\.json$', '', path[len('/1.1'):])
+            self._count(resource)
+            if self._fails():
+                return 503, {}, {'errors': [{'code': 130, 'message': 'Over capacity'}]}
+            return self._twitter(resource, params, headers)
+        path = GRAPH_VERSION_RE.sub('', path) or '/'
+        self._count('graph:/' + '/'.join(part if part in GRAPH_EDGES else '{id}'
+                                         for part in path.strip('/').split('/') if part))
+        if self._fails():
+            return 503, {}, {'error': {'message': 'Service temporarily unavailable', 'code': 2}}
+        if method == 'POST' and 'batch' in params:
+            return 200, {}, [self._graph_batch_item(request) for request in json.loads(params['batch'])]
+        status, body = self._graph(path, params)
+        return status, {}, body
+
+    def user(self, user_id):
+        return {'id': user_id, 'id_str': str(user_id), 'screen_name': 'user{}'.format(user_id),
+                'name': 'User {}'.format(user_id), 'protected': False,
+                'followers_count': self.followers_counts[user_id], 'friends_count': self.friends_counts[user_id],
+                'statuses_count': self.tweets_per_user}
+
+    def followers(self, user_id, start=0, stop=None):
+        """
+        :return: the follower ids of user_id from position start to stop. Follower
+                 k of a user is a fixed function of k, so no lists are kept in memory.
+        """
+        return self._neighbours(user_id, self.followers_counts[user_id], 7919, 104729, start, stop)
+
+    def friends(self, user_id, start=0, stop=None):
+        return self._neighbours(user_id, self.friends_counts[user_id], 6271, 130363, start, stop)
+
+    def tweet(self, user_id, number):
+        """
+        Tweet number (1 is the oldest) of user_id; every fifth tweet is a retweet.
+        """
+        created_at = TWEETS_START + datetime.timedelta(hours=number)
+        mentioned = (user_id * 31 + number) % self.users + 1
+        tweet = {'id': user_id * 10 ** 6 + number, 'id_str': str(user_id * 10 ** 6 + number),
+                 'created_at': created_at.strftime('%a %b %d %H:%M:%S %z %Y'),
+                 'text': '@user{} tweet {} #tag{} #tag{}'.format(mentioned, number, number % 7, number % 11),
+                 'user': {'id': user_id, 'screen_name': 'user{}'.format(user_id)},
+                 'entities': {'hashtags': [{'text': 'tag{}'.format(number % 7)},
+                                           {'text': 'tag{}'.format(number % 11)}],
+                              'user_mentions': [{'id': mentioned, 'screen_name': 'user{}'.format(mentioned)}]}}
+        if number % 5 == 0:
+            tweet['retweeted_status'] = {'id': mentioned * 10 ** 6 + number}
+        return tweet
+
+    def _twitter(self, resource, params, headers):
+        token = OAUTH_TOKEN_RE.search(headers.get('Authorization', ''))
+        token = token.group(1) if token else ''
+        limit = self.rate_limits.get(resource)
+        rate_limit_headers = {}
+        if limit is not None:
+            with self.lock:
+                quota = self.quota.get((token, resource))
+                now = time.time()
+                if quota is None or quota['reset'] <= now:
+                    quota = self.quota[(token, resource)] = {'remaining': limit, 'reset': int(now + self.window) + 1}
+                allowed = quota['remaining'] > 0
+                quota['remaining'] = max(0, quota['remaining'] - 1)
+            rate_limit_headers = {'x-rate-limit-limit': str(limit), 'x-rate-limit-remaining': str(quota['remaining']),
+                                  'x-rate-limit-reset': str(quota['reset'])}
+            if not allowed:
+                return 429, rate_limit_headers, {'errors': [{'code': 88, 'message': 'Rate limit exceeded'}]}
+        if resource in ('/followers/ids', '/friends/ids'):
+            status, body = self._twitter_ids(resource, params)
+        elif resource == '/users/lookup':
+            status, body = self._twitter_users(params)
+        elif resource == '/statuses/user_timeline':
+            status, body = self._twitter_timeline(params)
+        elif resource == '/application/rate_limit_status':
+            status, body = 200, self._twitter_rate_limit_status(token, params)
+        else:
+            status, body = 404, {'errors': [{'code': 34, 'message': 'Sorry, that page does not exist.'}]}
+        return status, rate_limit_headers, body
+
+    def _twitter_ids(self, resource, params):
+        user_id = self._get_user_id(params)
+        if user_id is None:
+            return 404, {'errors': [{'code': 50, 'message': 'User not found.'}]}
+        cursor = int(params.get('cursor', -1))
+        start = 0 if cursor == -1 else cursor
+        stop = start + min(int(params.get('count', 5000)), self.page_size)
+        neighbours = self.followers if resource == '/followers/ids' else self.friends
+        ids = neighbours(user_id, start, stop)
+        total = self.followers_counts[user_id] if resource == '/followers/ids' else self.friends_counts[user_id]
+        next_cursor = stop if stop < total else 0
+        return 200, {'ids': ids, 'next_cursor': next_cursor, 'next_cursor_str': str(next_cursor),
+                     'previous_cursor': 0, 'previous_cursor_str': '0'}
+
+    def _twitter_users(self, params):
+        if 'user_id' in params:
+            user_ids = [int(user_id) for user_id in params['user_id'].split(',')]
+        else:
+            user_ids = [self._parse_screen_name(screen_name) for screen_name in params.get('screen_name', '').split(',')]
+        users = [self.user(user_id) for user_id in user_ids[:100] if user_id and 1 <= user_id <= self.users]
+        if not users:
+            return 404, {'errors': [{'code': 17, 'message': 'No user matches for specified terms.'}]}
+        return 200, users
+
+    def _twitter_timeline(self, params):
+        user_id = self._get_user_id(params)
+        if user_id is None:
+            return 404, {'errors': [{'code': 34, 'message': 'Sorry, that page does not exist.'}]}
+        newest = self.tweets_per_user
+        if 'max_id' in params:
+            newest = min(newest, int(params['max_id']) - user_id * 10 ** 6)
+        oldest = 1
+        if 'since_id' in params:
+            oldest = max(oldest, int(params['since_id']) - user_id * 10 ** 6 + 1)
+        count = min(int(params.get('count', 20)), self.timeline_page_size)
+        numbers = range(newest, max(oldest, newest - count + 1) - 1, -1)
+        tweets = [self.tweet(user_id, number) for number in numbers]
+        if params.get('include_rts') in ('0', 'false'):
+            # Like Twitter, retweets still count towards count
+            tweets = [tweet for tweet in tweets if 'retweeted_status' not in tweet]
+        return 200, tweets
+
+    def _twitter_rate_limit_status(self, token, params):
+        families = params['resources'].split(',') if params.get('resources') else None
+        resources = {}
+        now = time.time()
+        with self.lock:
+            for resource, limit in self.rate_limits.items():
+                family = resource.split('/')[1]
+                if families and family not in families:
+                    continue
+                quota = self.quota.get((token, resource))
+                if quota is None or quota['reset'] <= now:
+                    quota = {'remaining': limit, 'reset': int(now + self.window)}
+                resources.setdefault(family, {})[resource] = {'limit': limit, 'remaining': quota['remaining'],
+                                                              'reset': quota['reset']}
+        return {'resources': resources}
+
+    def _graph(self, path, params):
+        parts = path.strip('/').split('/')
+        if parts == ['oauth', 'access_token']:
+            return 200, {'access_token': 'mock-access-token', 'token_type': 'bearer'}
+        if parts == ['']:
+            if 'ids' not in params:
+                return 400, {'error': {'message': 'Unsupported get request.', 'code': 100}}
+            return 200, {object_id: self._graph_object(object_id, params) for object_id in params['ids'].split(',')}
+        if parts == ['search']:
+            return 200, {'data': []}
+        if len(parts) == 1:
+            return 200, self._graph_object(parts[0], params)
+        if len(parts) == 2 and parts[1] in ('comments', 'feed'):
+            return 200, self._graph_edge(path, parts[0], parts[1], params)
+        if len(parts) == 2 and parts[1] == 'insights':
+            return 200, {'data': []}
+        return 400, {'error': {'message': 'Unknown path components: /{}'.format('/'.join(parts[1:])), 'code': 2500}}
+
+    def _graph_object(self, object_id, params):
+        graph_object = {'id': object_id, 'name': 'Object {}'.format(object_id)}
+        if params.get('metadata'):
+            graph_object['metadata'] = {'type': 'user'}
+        return graph_object
+
+    def _graph_edge(self, path, object_id, edge, params):
+        start = int(params.get('after', 0))
+        stop = min(start + min(int(params.get('limit', 25)), self.graph_page_size), self.comments_per_object)
+        data = []
+        for number in range(start, stop):
+            author = (sum(map(ord, object_id)) * 31 + number) % self.users + 1
+            data.append({'id': '{}_{}'.format(object_id, number),
+                         'created_time': (TWEETS_START + datetime.timedelta(minutes=number)).isoformat(),
+                         'message': '{} {}'.format(edge, number),
+                         'from': {'id': str(author), 'name': 'User {}'.format(author)}})
+        result = {'data': data, 'paging': {'cursors': {'before': str(start), 'after': str(stop)}}}
+        if stop < self.comments_per_object:
+            next_params = dict(params, after=stop)
+            result['paging']['next'] = '{}{}?{}'.format(self.url, path, parse.urlencode(next_params))
+        return result
+
+    def _graph_batch_item(self, request):
+        url = parse.urlparse('/' + request['relative_url'].lstrip('/'))
+        params = dict(parse.parse_qsl(url.query))
+        status, body = self._graph(GRAPH_VERSION_RE.sub('', url.path) or '/', params)
+        return {'code': status, 'body': json.dumps(body)}
+
+    def _get_user_id(self, params):
+        if 'user_id' in params:
+            user_id = int(params['user_id'])
+        else:
+            user_id = self._parse_screen_name(params.get('screen_name', ''))
+        return user_id if user_id and 1 <= user_id <= self.users else None
+
+    def _parse_screen_name(self, screen_name):
+        match = re.match(r'^user(\d+)$', screen_name.lower())
+        return int(match.group(1)) if match else None
+
+    def _neighbours(self, user_id, total, offset, step, start, stop):
+        stop = total if stop is None else min(stop, total)
+        return [(user_id * offset + k * step) % self.id_space + 1 for k in range(start, stop)]
+
+    def _draw_count(self, seed, user_id, mean):
+        count = int(mean / 2 * random.Random(seed * 1000003 + user_id).paretovariate(2))
+        return min(count, self.id_space)
+
+    def _count(self, endpoint):
+        with self.lock:
+            self.requests[endpoint] += 1
+
+    def _fails(self):
+        if not self.failure_rate:
+            return False
+        with self.lock:
+            return self.random.random() < self.failure_rate
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, which Nagle would delay by the delayed ACK timeout
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._respond('GET')
+
+    def do_POST(self):
+        self._respond('POST')
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, method):
+        url = parse.urlparse(self.path)
+        params = dict(parse.parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            params.update(parse.parse_qsl(self.rfile.read(length).decode('utf-8')))
+        status, headers, body = self.server.api.handle(method, url.path, params, self.headers)
+        body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == '__main__':
+    server = MockAPIServer(port=8000)
+    print('Mock API op {} (Twitter: {}, Facebook: {})'.format(server.url, server.twitter_url, server.facebook_url))
+    server.serve_forever()
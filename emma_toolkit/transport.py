@@ -0,0 +1,85 @@
+import logging
+import random
+import re
+import time
+from urllib import parse
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class Transport():
+
+    def __init__(self, pool_size=10, max_retries=5, backoff_factor=1, max_backoff=900, timeout=60, logger=None,
+                 metrics=None):
+        """
+        Pooled HTTP session shared by all requests of an API client. Connection
+        errors, timeouts and 5xx responses are retried with exponential backoff
+        and full jitter, at most max_retries times per request.
+
+        pool_size is the number of keep-alive connections per host
+        backoff_factor is the base delay in seconds, doubled after every retry
+        timeout is in seconds, per request
+        metrics is an emma_toolkit.metrics.Metrics instance the requests are recorded in
+        """
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.metrics = metrics
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, endpoint=None, **kwargs):
+        """
+        endpoint is the name the request is recorded under in metrics, defaults
+        to the path of url with numeric ids replaced by {id}
+        """
+        if method not in ('GET', 'POST'):
+            raise TypeError("'Method' should be either POST or GET.")
+        kwargs.setdefault('timeout', self.timeout)
+        if self.metrics and endpoint is None:
+            endpoint = re.sub(r'\d+', '{id}', parse.urlparse(url).path)
+        retries = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if self.metrics:
+                    self.metrics.record_request(endpoint, time.perf_counter() - start, 0, 599)
+                if retries >= self.max_retries:
+                    raise
+                reason = type(e).__name__
+            else:
+                if self.metrics:
+                    self.metrics.record_request(endpoint, time.perf_counter() - start, len(r.content), r.status_code)
+                    self._time_json(r, endpoint)
+                if r.status_code < 500 or retries >= self.max_retries:
+                    return r
+                reason = 'HTTP {}'.format(r.status_code)
+            delay = self._backoff(retries)
+            if self.metrics:
+                self.metrics.record_retry(endpoint, reason, delay)
+            self.logger.warning('{} bij {}, nieuwe poging over {:.1f} s.'.format(reason, url, delay))
+            time.sleep(delay)
+            retries += 1
+
+    def close(self):
+        self.session.close()
+
+    def _time_json(self, r, endpoint):
+        decode = r.json
+
+        def timed_json(**kwargs):
+            start = time.perf_counter()
+            try:
+                return decode(**kwargs)
+            finally:
+                self.metrics.record_decode(endpoint, time.perf_counter() - start)
+        r.json = timed_json
+
+    def _backoff(self, retries):
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** retries))
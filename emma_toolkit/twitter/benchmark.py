@@ -0,0 +1,98 @@
+import multiprocessing
+import time
+import tracemalloc
+import pandas as pd
+from ..metrics import Metrics
+from ..mockapi import MockAPIServer
+from .twitterapi import Twitter
+
+MOCK_CONFIG = {'consumer_key': 'mock', 'consumer_secret': 'mock', 'access_token': 'mock', 'access_secret': 'mock'}
+# High enough that the benchmarks measure the client, not the rate limit windows
+BENCHMARK_RATE_LIMITS = {'/followers/ids': 10 ** 6, '/friends/ids': 10 ** 6, '/users/lookup': 10 ** 6,
+                         '/statuses/user_timeline': 10 ** 6}
+
+
+def benchmark_twitter(sizes=(10, 100, 1000), mean_followers=2000, tweets_per_user=400, latency=0,
+                      failure_rate=0, concurrency=1, tokens=1, memory=True, **server_options):
+    """
+    Times get_follow_network, get_user_info and get_recent_tweets against a
+    MockAPIServer with a synthetic network of every size, served from a separate
+    process so only the client is measured. Without rate_limits in server_options
+    the rate limits are practically switched off.
+
+    :param sizes: numbers of users in the network
+    :param concurrency: concurrency of get_user_info
+    :param tokens: number of (mock) access tokens the client spreads requests over
+    :param memory: also measure the peak Python memory, in a second run as tracing
+                   allocations slows the client down
+    :param server_options: other keyword arguments of MockAPIServer, e.g. window or page_size
+    :return: Pandas DataFrame with requests, seconds, requests per second, retries and
+             peak Python memory (MB) per size and method
+    """
+    server_options.setdefault('rate_limits', BENCHMARK_RATE_LIMITS)
+    timings = []
+    for size in sizes:
+        options = dict(server_options, users=size, mean_followers=mean_followers,
+                       tweets_per_user=tweets_per_user, latency=latency, failure_rate=failure_rate)
+        process, url = _start_server(options)
+        try:
+            config = [dict(MOCK_CONFIG, access_token='mock{}'.format(token)) for token in range(tokens)]
+            screen_names = ['user{}'.format(user_id) for user_id in range(1, size + 1)]
+            user_ids = list(range(1, size + 1))
+            benchmarks = [('get_follow_network', lambda twitter: twitter.get_follow_network(screen_names)),
+                          ('get_user_info', lambda twitter: twitter.get_user_info(user_ids, concurrency=concurrency)),
+                          ('get_recent_tweets', lambda twitter: _get_timelines(twitter, user_ids))]
+            for method, run in benchmarks:
+                timing = _measure(Twitter(config, metrics=Metrics(), base_url=url), run, trace=False)
+                if memory:
+                    timing['peak_memory_mb'] = _measure(Twitter(config, metrics=Metrics(), base_url=url), run,
+                                                        trace=True)['peak_memory_mb']
+                timings.append(dict(timing, size=size, method=method))
+        finally:
+            process.terminate()
+            process.join()
+    timings = pd.DataFrame(timings).set_index(['size', 'method'])
+    timings['requests_per_second'] = timings['requests'] / timings['seconds']
+    columns = ['requests', 'seconds', 'requests_per_second', 'retries']
+    return timings[columns + ['peak_memory_mb'] if memory else columns]
+
+
+def _measure(twitter, run, trace):
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        run(twitter)
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace else None
+    finally:
+        if trace:
+            tracemalloc.stop()
+        twitter.transport.close()
+    totals = twitter.metrics.summary()['totals']
+    return {'requests': totals['requests'], 'seconds': seconds, 'retries': totals['retries'],
+            'peak_memory_mb': peak / 1e6 if trace else None}
+
+
+def _get_timelines(twitter, user_ids):
+    # The timelines are not kept, so the peak memory is that of one get_recent_tweets
+    for user_id in user_ids:
+        twitter.get_recent_tweets(user_id)
+
+
+def _start_server(options):
+    urls = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(options, urls), daemon=True)
+    process.start()
+    return process, urls.get(timeout=60)
+
+
+def _serve(options, urls):
+    server = MockAPIServer(**options)
+    urls.put(server.twitter_url)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    pd.set_option('display.width', 120)
+    print(benchmark_twitter())
@@ -0,0 +1,137 @@
+import json
+import sqlite3
+import time
+
+
+class CrawlState():
+
+    def __init__(self, path):
+        """
+        Crawl state of get_follow_network in a SQLite database (in WAL mode):
+        the users to crawl, the cursor of every user, which users are done and
+        the edges found so far. Every page is committed together with its
+        cursor, so a crawl can resume exactly where it stopped.
+
+        path is the name of the database file
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, '
+                                    'position INTEGER, next_cursor INTEGER, done INTEGER, info TEXT, '
+                                    'pages INTEGER DEFAULT 0)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS edges (source INTEGER, target INTEGER)')
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(users)')]
+            if 'pages' not in columns:
+                # State files from before the pages column
+                self.connection.execute('ALTER TABLE users ADD COLUMN pages INTEGER DEFAULT 0')
+
+    def reset(self):
+        with self.connection:
+            self.connection.execute('DELETE FROM users')
+            self.connection.execute('DELETE FROM edges')
+
+    def has_users(self):
+        return self.connection.execute('SELECT COUNT(*) FROM users').fetchone()[0] > 0
+
+    def set_nodes(self, users_info):
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO users (user_id, position, next_cursor, done, info, pages) '
+                'VALUES (?, ?, -1, 0, ?, 0)',
+                [(user['id'], position, json.dumps(user)) for position, user in enumerate(users_info)])
+
+    def get_nodes(self):
+        rows = self.connection.execute('SELECT info FROM users ORDER BY position')
+        return [json.loads(info) for info, in rows]
+
+    def pending_users(self):
+        """
+        :return: list of (user_id, next_cursor) of the users that are not done, in crawl order
+        """
+        return self.connection.execute(
+            'SELECT user_id, next_cursor FROM users WHERE done = 0 ORDER BY position').fetchall()
+
+    def save_page(self, user_id, edges, next_cursor):
+        """
+        Stores the edges of one page and the cursor of the next page in one
+        transaction. The user is done when next_cursor is 0.
+        """
+        with self.connection:
+            self.connection.executemany('INSERT INTO edges (source, target) VALUES (?, ?)', edges)
+            self.connection.execute('UPDATE users SET next_cursor = ?, done = ?, pages = pages + 1 '
+                                    'WHERE user_id = ?', (next_cursor, int(next_cursor == 0), user_id))
+
+    def get_pages(self):
+        """
+        :return: Dict: {user_id: number of pages stored} of the users that are not done
+        """
+        return dict(self.connection.execute('SELECT user_id, pages FROM users WHERE done = 0 AND pages > 0'))
+
+    def mark_done(self, user_id):
+        with self.connection:
+            self.connection.execute('UPDATE users SET done = 1 WHERE user_id = ?', (user_id,))
+
+    def get_edges(self):
+        return self.connection.execute('SELECT source, target FROM edges ORDER BY rowid').fetchall()
+
+    def close(self):
+        self.connection.close()
+
+
+class TimelineState():
+
+    def __init__(self, path):
+        """
+        High-water marks of incremental timeline syncs in a SQLite database: the
+        id of the newest tweet fetched per user, used as since_id in the next sync.
+        When a sync stopped before it reached since_id (an error, or count), the
+        tweets it did not reach are kept as a gap (since_id, max_id), which the
+        next sync fetches first.
+
+        path is the name of the database file
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS since_ids (user TEXT PRIMARY KEY, '
+                                    'since_id INTEGER, synced_at REAL, gap_since_id INTEGER, gap_max_id INTEGER)')
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(since_ids)')]
+            if 'gap_max_id' not in columns:
+                # State files from before the gap columns
+                self.connection.execute('ALTER TABLE since_ids ADD COLUMN gap_since_id INTEGER')
+                self.connection.execute('ALTER TABLE since_ids ADD COLUMN gap_max_id INTEGER')
+
+    def get_since_id(self, user):
+        row = self.connection.execute('SELECT since_id FROM since_ids WHERE user = ?', (str(user),)).fetchone()
+        return row[0] if row else None
+
+    def set_since_id(self, user, since_id, gap=None):
+        """
+        :param gap: tuple (since_id, max_id) of the tweets the sync did not reach, or None
+        """
+        gap_since_id, gap_max_id = gap if gap else (None, None)
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO since_ids (user, since_id, synced_at, gap_since_id, '
+                                    'gap_max_id) VALUES (?, ?, ?, ?, ?)',
+                                    (str(user), since_id, time.time(), gap_since_id, gap_max_id))
+
+    def get_gap(self, user):
+        """
+        :return: tuple (since_id, max_id) of the tweets a previous sync did not reach, or None
+        """
+        row = self.connection.execute('SELECT gap_since_id, gap_max_id FROM since_ids WHERE user = ?',
+                                      (str(user),)).fetchone()
+        return (row[0], row[1]) if row and row[1] is not None else None
+
+    def set_gap(self, user, gap):
+        gap_since_id, gap_max_id = gap if gap else (None, None)
+        with self.connection:
+            self.connection.execute('UPDATE since_ids SET gap_since_id = ?, gap_max_id = ? WHERE user = ?',
+                                    (gap_since_id, gap_max_id, str(user)))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+NODE_ATTRIBUTES = ['id', 'screen_name', 'name', 'followers_count', 'friends_count', 'statuses_count']
+
+
+class Graph():
+
+    def __init__(self, node_ids, indptr, indices, weights=None, node_attributes=None):
+        """
+        Directed graph with integer-indexed nodes and CSR adjacency: the
+        out-neighbours of node i are indices[indptr[i]:indptr[i+1]].
+        Use Graph.from_edges or Graph.load to create one.
+
+        node_ids holds the original id (user id or screen name) of every node
+        node_attributes is a DataFrame with one row per node, in the same order
+        """
+        self.node_ids = np.asarray(node_ids)
+        self.indptr = np.asarray(indptr, dtype='int64')
+        self.indices = np.asarray(indices, dtype='int64')
+        self.weights = np.asarray(weights, dtype='int64') if weights is not None else None
+        if node_attributes is None:
+            node_attributes = pd.DataFrame(index=range(len(self.node_ids)))
+        self.node_attributes = node_attributes
+        self._in_indptr = None
+        self._in_indices = None
+
+    @classmethod
+    def from_edges(cls, sources, targets, weights=None, nodes=None, node_ids=None, attributes=NODE_ATTRIBUTES):
+        """
+        :param sources: array-like of source ids
+        :param targets: array-like of target ids
+        :param weights: array-like of edge weights, optional
+        :param nodes: list of node dicts (e.g. from get_user_info) to take the attributes from
+        :param node_ids: the id of every dict in nodes, defaults to their 'id'
+        :param attributes: keys of the node dicts to keep
+        :return: Graph
+        """
+        nodes = nodes or []
+        if node_ids is None:
+            node_ids = [node['id'] for node in nodes]
+        parts = [np.asarray(ids) for ids in (node_ids, sources, targets) if len(ids)]
+        all_ids = np.unique(np.concatenate(parts)) if parts else np.array([], dtype='int64')
+        if all_ids.dtype == object:
+            all_ids = all_ids.astype(str)
+        sources = np.asarray(sources, dtype=all_ids.dtype)
+        targets = np.asarray(targets, dtype=all_ids.dtype)
+        source_index = np.searchsorted(all_ids, sources)
+        target_index = np.searchsorted(all_ids, targets)
+        order = np.lexsort((target_index, source_index))
+        indptr = np.zeros(len(all_ids) + 1, dtype='int64')
+        np.cumsum(np.bincount(source_index, minlength=len(all_ids)), out=indptr[1:])
+        if weights is not None:
+            weights = np.asarray(weights)[order]
+        node_attributes = pd.DataFrame([{key: node.get(key) for key in attributes} for node in nodes],
+                                       columns=attributes)
+        node_index = np.searchsorted(all_ids, np.asarray(node_ids, dtype=all_ids.dtype))
+        node_attributes.index = node_index.astype('int64')
+        node_attributes = node_attributes[~node_attributes.index.duplicated()].reindex(range(len(all_ids)))
+        return cls(all_ids, indptr, target_index[order], weights, node_attributes)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            columns = [key[len('attribute_'):] for key in data.files if key.startswith('attribute_')]
+            node_attributes = pd.DataFrame({column: data['attribute_' + column] for column in columns})
+            return cls(data['node_ids'], data['indptr'], data['indices'],
+                       data['weights'] if 'weights' in data.files else None, node_attributes)
+
+    def save(self, path):
+        """
+        Saves the graph as an uncompressed npz-file.
+        """
+        arrays = {'node_ids': self.node_ids, 'indptr': self.indptr, 'indices': self.indices}
+        if self.weights is not None:
+            arrays['weights'] = self.weights
+        for column in self.node_attributes.columns:
+            values = self.node_attributes[column]
+            if pd.api.types.is_numeric_dtype(values):
+                arrays['attribute_' + column] = values.to_numpy()
+            else:
+                arrays['attribute_' + column] = values.fillna('').astype(str).to_numpy(dtype=str)
+        np.savez(path, **arrays)
+
+    def number_of_nodes(self):
+        return len(self.node_ids)
+
+    def number_of_edges(self):
+        return len(self.indices)
+
+    def index_of(self, node_id):
+        index = np.searchsorted(self.node_ids, node_id)
+        if index >= len(self.node_ids) or self.node_ids[index] != node_id:
+            raise KeyError(node_id)
+        return int(index)
+
+    def out_degree(self, node_id=None):
+        degrees = np.diff(self.indptr)
+        return degrees if node_id is None else int(degrees[self.index_of(node_id)])
+
+    def in_degree(self, node_id=None):
+        degrees = np.bincount(self.indices, minlength=len(self.node_ids))
+        return degrees if node_id is None else int(degrees[self.index_of(node_id)])
+
+    def successors(self, node_id):
+        """
+        :return: array with the ids of the out-neighbours of node_id
+        """
+        index = self.index_of(node_id)
+        return self.node_ids[self.indices[self.indptr[index]:self.indptr[index + 1]]]
+
+    def predecessors(self, node_id):
+        """
+        :return: array with the ids of the in-neighbours of node_id
+        """
+        if self._in_indptr is None:
+            sources = np.repeat(np.arange(len(self.node_ids)), np.diff(self.indptr))
+            order = np.argsort(self.indices, kind='stable')
+            self._in_indices = sources[order]
+            self._in_indptr = np.zeros(len(self.node_ids) + 1, dtype='int64')
+            np.cumsum(np.bincount(self.indices, minlength=len(self.node_ids)), out=self._in_indptr[1:])
+        index = self.index_of(node_id)
+        return self.node_ids[self._in_indices[self._in_indptr[index]:self._in_indptr[index + 1]]]
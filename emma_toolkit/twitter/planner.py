@@ -0,0 +1,139 @@
+import datetime
+import math
+import time
+from collections import Counter
+
+# Calls per window per token (user auth) of the endpoints a follow network crawl uses
+RATE_LIMITS = {'/followers/ids': 15, '/friends/ids': 15, '/users/lookup': 900}
+
+
+class CrawlPlanner():
+
+    def __init__(self, users_info, rate_limiters, metrics=None, resource='/followers/ids', page_size=5000,
+                 order='input', window=900, seconds_per_request=1.0):
+        """
+        Crawl schedule and ETA of get_follow_network, from the followers_count of
+        every user. Every endpoint is planned against its own budget: the
+        remaining calls and reset times the rate limiters of all tokens report,
+        or the RATE_LIMITS of a fresh window for the endpoints not called yet.
+        The ETA is re-estimated on every call from those budgets and the
+        observed seconds per request in metrics.
+
+        users_info is a list of user dicts (from get_user_info)
+        rate_limiters is the list of RateLimiters of the client, one per token
+        order is 'input' to crawl in the given order, or 'cheapest' to crawl the
+        users with the fewest followers first, for early partial results
+        seconds_per_request is used until metrics has observed a request
+        """
+        if order not in ('input', 'cheapest'):
+            raise ValueError('Parameter "order" should be one of [input, cheapest]')
+        self.rate_limiters = rate_limiters
+        self.metrics = metrics
+        self.resource = resource
+        self.order = order
+        self.window = window
+        self.seconds_per_request = seconds_per_request
+        self.costs = {user['id']: self._get_pages(user, page_size) for user in users_info}
+        self.done = set()
+        self.pages = Counter()
+        self.pages_done = 0
+        self.started = time.time()
+
+    def schedule(self, user_ids=None):
+        """
+        :param user_ids: the users to crawl, defaults to all; items may also be
+                         tuples starting with the user id, such as (user_id, cursor)
+        :return: user_ids in crawl order
+        """
+        if user_ids is None:
+            user_ids = list(self.costs)
+        if self.order == 'cheapest':
+            # sorted is stable, so users with the same cost keep the input order
+            return sorted(user_ids, key=lambda user: self._remaining(user[0] if isinstance(user, tuple) else user))
+        return list(user_ids)
+
+    def record_page(self, user_id):
+        self.pages[user_id] += 1
+        self.pages_done += 1
+
+    def set_pages(self, pages):
+        """
+        :param pages: Dict: {user_id: pages fetched before}, e.g. of a resumed crawl,
+                      which no longer count as remaining
+        """
+        self.pages.update(pages)
+
+    def mark_done(self, user_id):
+        self.done.add(user_id)
+
+    def remaining_pages(self):
+        return sum(max(0, pages - self.pages[user_id]) for user_id, pages in self.costs.items()
+                   if user_id not in self.done)
+
+    def estimate_seconds(self, resource=None, calls=None):
+        """
+        :return: seconds needed for calls requests on resource (by default the
+                 remaining pages of the crawl), given the current budget of every
+                 token and the observed time per request
+        """
+        resource = resource if resource else self.resource
+        if calls is None:
+            calls = self.remaining_pages()
+        if not calls:
+            return 0
+        now = time.time()
+        limit = RATE_LIMITS.get(resource, 15)
+        available = 0
+        next_reset = now + self.window
+        margin = 0
+        for rate_limiter in self.rate_limiters:
+            remaining = rate_limiter.remaining(resource)
+            known = rate_limiter.limits.get(resource)
+            if known and known['limit']:
+                limit = known['limit']
+            if remaining is None:
+                available += limit
+            else:
+                available += remaining
+                next_reset = min(next_reset, rate_limiter.reset_time(resource))
+            margin = rate_limiter.margin
+        capacity = limit * len(self.rate_limiters)
+        seconds_per_request = self.observed_seconds_per_request(resource)
+        network_bound = calls * seconds_per_request
+        if calls <= available:
+            return network_bound
+        extra = calls - available
+        windows = int(math.ceil(extra / capacity))
+        window_bound = (max(0, next_reset + margin - now) + (windows - 1) * (self.window + margin) +
+                        (extra - (windows - 1) * capacity) * seconds_per_request)
+        return max(network_bound, window_bound)
+
+    def observed_seconds_per_request(self, resource=None):
+        resource = resource if resource else self.resource
+        if self.metrics:
+            stats = self.metrics.summary()['endpoints'].get(resource)
+            if stats and stats['requests']:
+                return (stats['network_time'] + stats['decode_time']) / stats['requests']
+        return self.seconds_per_request
+
+    def eta(self):
+        return datetime.datetime.now() + datetime.timedelta(seconds=self.estimate_seconds())
+
+    def progress(self):
+        """
+        :return: Dict with users and pages done and remaining, observed pages per
+                 second (sleeps included), and the estimated seconds to go and ETA
+        """
+        seconds = self.estimate_seconds()
+        elapsed = time.time() - self.started
+        return {'users_done': len(self.done), 'users_remaining': len(self.costs) - len(self.done),
+                'pages_done': self.pages_done, 'pages_remaining': self.remaining_pages(),
+                'pages_per_second': self.pages_done / elapsed if elapsed else 0.0,
+                'seconds_remaining': seconds, 'eta': datetime.datetime.now() + datetime.timedelta(seconds=seconds)}
+
+    def _remaining(self, user_id):
+        return max(1, self.costs.get(user_id, 1) - self.pages[user_id])
+
+    def _get_pages(self, user, page_size):
+        # Every user costs at least one call, also without followers or when protected
+        return max(1, int(math.ceil((user.get('followers_count') or 0) / page_size)))
@@ -0,0 +1,66 @@
+import threading
+import time
+
+
+class RateLimiter():
+
+    def __init__(self, window=900, margin=5):
+        """
+        Keeps the rate limit state of every endpoint up to date from the
+        x-rate-limit-* headers of the responses, so no quota is spent on polling
+        rate_limit_status.
+
+        window is the length of a rate limit window in seconds, used when a
+        response says the limit is reached but has no reset header
+        margin is the number of seconds to wait past the reset time
+        """
+        self.window = window
+        self.margin = margin
+        self.limits = {}
+        self.lock = threading.Lock()
+
+    def update(self, resource, headers):
+        if 'x-rate-limit-remaining' not in headers or 'x-rate-limit-reset' not in headers:
+            return
+        with self.lock:
+            self.limits[resource] = {'limit': int(headers.get('x-rate-limit-limit', 0)),
+                                     'remaining': int(headers['x-rate-limit-remaining']),
+                                     'reset': int(headers['x-rate-limit-reset'])}
+
+    def exhaust(self, resource, headers=None):
+        if headers:
+            self.update(resource, headers)
+        with self.lock:
+            limit = self.limits.setdefault(resource, {'limit': 0, 'remaining': 0, 'reset': 0})
+            limit['remaining'] = 0
+            if limit['reset'] <= time.time():
+                limit['reset'] = int(time.time() + self.window)
+
+    def acquire(self, resource):
+        """
+        Reserves one call on resource. Returns 0 if the call can be made now,
+        otherwise the number of seconds to wait before trying again.
+        """
+        with self.lock:
+            limit = self.limits.get(resource)
+            if limit is None:
+                return 0
+            now = time.time()
+            if limit['remaining'] > 0:
+                limit['remaining'] -= 1
+                return 0
+            if limit['reset'] + self.margin <= now:
+                # The window has passed, the next response will tell the new state
+                del self.limits[resource]
+                return 0
+            return limit['reset'] + self.margin - now
+
+    def remaining(self, resource):
+        limit = self.limits.get(resource)
+        if limit is None or limit['reset'] + self.margin <= time.time():
+            return None
+        return limit['remaining']
+
+    def reset_time(self, resource):
+        limit = self.limits.get(resource)
+        return limit['reset'] if limit else None
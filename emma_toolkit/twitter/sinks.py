@@ -0,0 +1,136 @@
+import json
+import unicodecsv as csv
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+class Sink():
+
+    def __init__(self, path, fieldnames=None, buffer_size=10000):
+        """
+        Base class of the sinks: rows are buffered in memory and written to
+        path in one go when buffer_size rows are waiting, or on flush().
+
+        fieldnames are the names of the columns. Rows can be dicts or sequences
+        in the order of fieldnames.
+        """
+        self.path = path
+        self.fieldnames = fieldnames
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.rows_written = 0
+
+    def write(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def write_many(self, rows):
+        self.buffer.extend(rows)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self._write_rows(self.buffer)
+            self.rows_written += len(self.buffer)
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write_rows(self, rows):
+        raise NotImplementedError
+
+    def _as_dict(self, row):
+        if isinstance(row, dict):
+            if self.fieldnames:
+                return {field: row.get(field) for field in self.fieldnames}
+            return row
+        if not self.fieldnames:
+            raise ValueError('fieldnames are required to write rows that are not dicts')
+        return dict(zip(self.fieldnames, row))
+
+
+class CSVSink(Sink):
+
+    def __init__(self, path, fieldnames, buffer_size=10000, append=False):
+        """
+        Writes rows to a csv-file. The header is written unless append is True.
+        """
+        super().__init__(path, fieldnames, buffer_size)
+        self.file = open(path, 'ab' if append else 'wb')
+        self.writer = csv.writer(self.file, encoding='utf-8', delimiter=',')
+        if not append:
+            self.writer.writerow(fieldnames)
+
+    def flush(self):
+        super().flush()
+        self.file.flush()
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+    def _write_rows(self, rows):
+        self.writer.writerows([[row.get(field) for field in self.fieldnames] if isinstance(row, dict) else row
+                               for row in rows])
+
+
+class JSONLSink(Sink):
+
+    def __init__(self, path, fieldnames=None, buffer_size=10000, append=False):
+        """
+        Writes every row as a JSON object on its own line.
+        """
+        super().__init__(path, fieldnames, buffer_size)
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def flush(self):
+        super().flush()
+        self.file.flush()
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+    def _write_rows(self, rows):
+        self.file.write(''.join(json.dumps(self._as_dict(row), ensure_ascii=False) + '\n' for row in rows))
+
+
+class ParquetSink(Sink):
+
+    def __init__(self, path, fieldnames=None, buffer_size=100000):
+        """
+        Writes rows to a Parquet file, one row group per flush. The schema is
+        taken from the first rows written, so pass fieldnames to keep nested
+        objects such as tweets to a fixed set of columns.
+        """
+        if pa is None:
+            raise ImportError("ParquetSink requires pyarrow, install it with 'pip install pyarrow'")
+        super().__init__(path, fieldnames, buffer_size)
+        self.writer = None
+
+    def close(self):
+        super().close()
+        if self.writer:
+            self.writer.close()
+
+    def _write_rows(self, rows):
+        rows = [self._as_dict(row) for row in rows]
+        if self.writer is None:
+            table = pa.Table.from_pylist(rows)
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = pa.Table.from_pylist(rows, schema=self.writer.schema)
+        self.writer.write_table(table)
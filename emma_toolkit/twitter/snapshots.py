@@ -0,0 +1,186 @@
+import json
+import os
+import time
+import numpy as np
+from .graph import Graph
+
+
+class SnapshotStore():
+
+    def __init__(self, path, checkpoint_every=10):
+        """
+        Weekly (or any other) snapshots of a follow network in a directory. The
+        first snapshot is stored in full, every next one only as the edges added
+        and removed since the previous snapshot, so storage grows with the churn
+        instead of with the size of the network. Edges are kept as sorted int64
+        arrays and compared with vectorized set operations.
+
+        path is the directory of the store; it is created if needed
+        checkpoint_every is the number of deltas after which a snapshot is stored
+        in full again, which bounds the number of deltas to apply to rebuild one
+        """
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        os.makedirs(path, exist_ok=True)
+        self.manifest_file = os.path.join(path, 'manifest.json')
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = []
+        self._latest = None
+
+    def snapshots(self):
+        """
+        :return: list of dicts with the id, creation time, number of edges and the
+                 numbers of added and removed edges of every snapshot
+        """
+        return [dict(snapshot) for snapshot in self.manifest]
+
+    def add(self, sources, targets, nodes=None):
+        """
+        :param sources: array-like of the source id of every edge
+        :param targets: array-like of the target id of every edge
+        :param nodes: list of node dicts (e.g. from get_user_info) to keep with the snapshot
+        :return: id of the new snapshot
+        """
+        edges = sort_edges(sources, targets)
+        snapshot_id = len(self.manifest)
+        snapshot = {'id': snapshot_id, 'created': time.time(), 'edges': len(edges[0])}
+        deltas = 0
+        for previous in reversed(self.manifest):
+            if previous['full']:
+                break
+            deltas += 1
+        if not self.manifest or deltas + 1 >= self.checkpoint_every:
+            previous_edges = self.get_edges(-1) if self.manifest else _empty_edges()
+            arrays = {'sources': edges[0], 'targets': edges[1]}
+            snapshot['full'] = True
+        else:
+            previous_edges = self.get_edges(-1)
+            arrays = {}
+            snapshot['full'] = False
+        added = difference(edges, previous_edges)
+        removed = difference(previous_edges, edges)
+        if self.manifest:
+            # The delta of the first snapshot is the snapshot itself
+            arrays.update({'added_sources': added[0], 'added_targets': added[1],
+                           'removed_sources': removed[0], 'removed_targets': removed[1]})
+        snapshot['added'] = len(added[0])
+        snapshot['removed'] = len(removed[0])
+        self._write(self._get_file(snapshot_id, '.npz'), lambda f: np.savez(f, **arrays))
+        self._write(self._get_file(snapshot_id, '.json'), lambda f: f.write(json.dumps(nodes or []).encode('utf-8')))
+        self.manifest.append(snapshot)
+        self._write(self.manifest_file, lambda f: f.write(json.dumps(self.manifest).encode('utf-8')))
+        self._latest = (snapshot_id, edges)
+        return snapshot_id
+
+    def get_edges(self, snapshot_id=-1):
+        """
+        Rebuilds a snapshot from the last full snapshot before it and the deltas since.
+
+        :return: tuple of sorted int64 arrays (sources, targets)
+        """
+        snapshot_id = self._get_id(snapshot_id)
+        if self._latest and self._latest[0] == snapshot_id:
+            return self._latest[1]
+        start = snapshot_id
+        while not self.manifest[start]['full']:
+            start -= 1
+        with np.load(self._get_file(start, '.npz')) as data:
+            edges = (data['sources'], data['targets'])
+        for delta_id in range(start + 1, snapshot_id + 1):
+            added, removed = self._load_delta(delta_id)
+            edges = sort_edges(*[np.concatenate(parts) for parts in zip(difference(edges, removed), added)])
+        return edges
+
+    def get_nodes(self, snapshot_id=-1):
+        with open(self._get_file(self._get_id(snapshot_id), '.json')) as f:
+            return json.load(f)
+
+    def get_delta(self, snapshot_id=-1):
+        """
+        :return: Dict: {added, removed}, the edges added and removed since the previous
+                 snapshot, each a tuple of sorted int64 arrays (sources, targets)
+        """
+        added, removed = self._load_delta(self._get_id(snapshot_id))
+        return {'added': added, 'removed': removed}
+
+    def diff(self, old_snapshot_id, new_snapshot_id=-1):
+        """
+        :return: Dict: {added, removed} between any two snapshots
+        """
+        old_edges = self.get_edges(old_snapshot_id)
+        new_edges = self.get_edges(new_snapshot_id)
+        return {'added': difference(new_edges, old_edges), 'removed': difference(old_edges, new_edges)}
+
+    def get_graph(self, snapshot_id=-1):
+        sources, targets = self.get_edges(snapshot_id)
+        return Graph.from_edges(sources, targets, nodes=self.get_nodes(snapshot_id))
+
+    def _load_delta(self, snapshot_id):
+        with np.load(self._get_file(snapshot_id, '.npz')) as data:
+            if 'added_sources' not in data.files:
+                return (data['sources'], data['targets']), _empty_edges()
+            return ((data['added_sources'], data['added_targets']),
+                    (data['removed_sources'], data['removed_targets']))
+
+    def _get_id(self, snapshot_id):
+        if not self.manifest:
+            raise KeyError('Geen snapshots in {}'.format(self.path))
+        return range(len(self.manifest))[snapshot_id]
+
+    def _get_file(self, snapshot_id, extension):
+        return os.path.join(self.path, 'snapshot_{:05d}{}'.format(snapshot_id, extension))
+
+    def _write(self, path, write):
+        temp_file = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp_file, 'wb') as f:
+            write(f)
+        os.replace(temp_file, path)
+
+
+def sort_edges(sources, targets):
+    """
+    :return: tuple of int64 arrays (sources, targets), sorted by source and then
+             target, without duplicate edges
+    """
+    sources = np.asarray(sources, dtype='int64')
+    targets = np.asarray(targets, dtype='int64')
+    node_ids, keys = _get_keys((sources, targets))
+    keys = _unique(keys[0])
+    return node_ids[keys // len(node_ids)], node_ids[keys % len(node_ids)]
+
+
+def difference(edges, other_edges):
+    """
+    :param edges: tuple of sorted int64 arrays (sources, targets), as from sort_edges
+    :return: the edges that are not in other_edges, in the same form
+    """
+    if not len(edges[0]) or not len(other_edges[0]):
+        return edges
+    node_ids, (keys, other_keys) = _get_keys(edges, other_edges)
+    positions = np.minimum(np.searchsorted(other_keys, keys), len(other_keys) - 1)
+    keep = other_keys[positions] != keys
+    return edges[0][keep], edges[1][keep]
+
+
+def _get_keys(*edge_lists):
+    # One int64 per edge that sorts like (source, target): the position of the
+    # source and of the target in the sorted ids of all edge lists combined
+    node_ids = _unique(np.concatenate([ids for edges in edge_lists for ids in edges]))
+    keys = [np.searchsorted(node_ids, edges[0]) * len(node_ids) + np.searchsorted(node_ids, edges[1])
+            for edges in edge_lists]
+    return node_ids, keys
+
+
+def _unique(values):
+    # Sorting and dropping repeats is several times faster than np.unique here
+    values = np.sort(values)
+    if len(values):
+        values = values[np.concatenate([[True], values[1:] != values[:-1]])]
+    return values
+
+
+def _empty_edges():
+    return np.array([], dtype='int64'), np.array([], dtype='int64')
@@ -1,29 +1,59 @@
 import requests
 from requests_oauthlib import OAuth1
+import functools
+import itertools
 import math
+import multiprocessing
 import time
 import re
 import datetime
 import logging
-import unicodecsv as csv
 import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from urllib import parse
+from ..cache import ResponseCache
+from ..metrics import Metrics
+from ..transport import Transport
+from .crawlstate import CrawlState, TimelineState
+from .graph import Graph
+from .planner import CrawlPlanner
+from .snapshots import SnapshotStore
+from .ratelimits import RateLimiter
+from .sinks import CSVSink
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
 
 class Twitter():
 
-    def __init__(self, config, log_file='', temp_file=''):
+    def __init__(self, config, log_file='', temp_file='', pool_size=10, max_retries=5, backoff_factor=1,
+                 cache_file='', cache_ttl=None, cache_max_entries=1000000, metrics=None,
+                 base_url='https://api.twitter.com/1.1'):
         """
         config is a dict containing: consumer_key; consumer_secret;
                                      access_token; access_secret
+               or a list of such dicts, to spread requests over several tokens
         log_file is the name for a txt-file
         temp_file is the name for a csv-file
+        pool_size, max_retries and backoff_factor configure the HTTP transport
+        cache_file is the name for a SQLite file in which user lookups are cached;
+        cache_ttl is the time to live in seconds, one number or a dict per endpoint
+        metrics is an emma_toolkit.metrics.Metrics instance, to share one between clients
+        base_url is the root of the API, e.g. emma_toolkit.mockapi.MockAPIServer.twitter_url
         """
-        self.oauth = OAuth1(config['consumer_key'],
-                       config['consumer_secret'],
-                       config['access_token'],
-                       config['access_secret']
-                       )
-        self.base_url = 'https://api.twitter.com/1.1'
-        self.rate_limits = {}
+        configs = config if isinstance(config, list) else [config]
+        if not configs:
+            raise ValueError("config should contain at least one set of credentials")
+        self._set_credentials([OAuth1(config['consumer_key'],
+                                      config['consumer_secret'],
+                                      config['access_token'],
+                                      config['access_secret']
+                                      ) for config in configs])
+        self.base_url = base_url
         if log_file:
             if not log_file.endswith('.txt'):
                 raise ValueError("log_file name should end in .txt")
@@ -31,35 +61,88 @@ class Twitter():
             self.logging_on = True
         else:
             self.logging_on = False
+        self.metrics = metrics if metrics else Metrics()
+        self.transport = Transport(pool_size=pool_size, max_retries=max_retries, backoff_factor=backoff_factor,
+                                   logger=self.logger if self.logging_on else None, metrics=self.metrics)
         if temp_file:
             if not temp_file.endswith('.csv'):
                 raise ValueError("temp_file name should end in .csv")
             self.temp_file = temp_file
-            with open(temp_file, 'wb') as f:
-                writer = csv.writer(f, encoding='utf-8', delimiter=',')
-                writer.writerow(['source', 'target'])
-                f.close()
+            CSVSink(temp_file, ['source', 'target']).close()
         else:
             self.temp_file = None
+        if cache_file:
+            if cache_ttl is None:
+                cache_ttl = {'/users/lookup': 86400}
+            self.cache = ResponseCache(cache_file, ttl=cache_ttl, max_entries=cache_max_entries)
+        else:
+            self.cache = None
 
     def set_auth(self, consumer_key, consumer_secret, access_token, access_secret):
-        self.oauth = OAuth1(consumer_key, consumer_secret, access_token, access_secret)
+        self._set_credentials([OAuth1(consumer_key, consumer_secret, access_token, access_secret)])
+
+    def _set_credentials(self, credentials):
+        self.credentials = credentials
+        self.rate_limiters = [RateLimiter() for _ in credentials]
+        self.oauth = credentials[0]
+        self.rate_limiter = self.rate_limiters[0]
+        self.rate_limits = self.rate_limiter.limits
 
     def show_friendship(self, source, target):
         url = self.base_url + '/friendships/show.json'
         params = {'source_screen_name': source,
                   'target_screen_name': target}
-        # TODO rate limits inbouwen
         r = self._request(url, params)
         friendship = r.json()
         return {'following': friendship['relationship']['source']['following'],
                 'followed': friendship['relationship']['source']['followed_by']}
 
     def get_followers(self, user, include_user_ids=None, cursor=-1, count=5000, iterate=True, verbose=False):
-        if '/followers/ids' not in self.rate_limits:
-            self.rate_limits['/followers/ids'] = self.get_rate_limit('followers')['followers']['/followers/ids']
         follower_ids = []
+        for followers_to_include in self.iter_followers(user, include_user_ids, cursor, count, iterate, verbose):
+            follower_ids += followers_to_include
+        return follower_ids
+
+    def iter_followers(self, user, include_user_ids=None, cursor=-1, count=5000, iterate=True, verbose=False):
+        """
+        Yields the follower ids of user page by page.
+        """
+        for followers_to_include, next_cursor in self._iter_follower_pages(user, include_user_ids, cursor, count,
+                                                                          iterate, verbose):
+            yield followers_to_include
+
+    def _iter_follower_pages(self, user, include_user_ids=None, cursor=-1, count=5000, iterate=True, verbose=False,
+                             errors=None):
+        """
+        Yields (follower_ids, next_cursor) per page. Stops at the last page, or
+        after logging an error; the status code of that response is appended to
+        errors, if given.
+        """
         url = self.base_url + '/followers/ids.json'
+        if include_user_ids:
+            include_user_ids = set(include_user_ids)
+        if verbose:
+            print('Volgers binnenhalen van gebruiker {} ...'.format(str(user)))
+        for user_ids, next_cursor in self._iter_cursor_pages(url, user, cursor, count, iterate, verbose, errors):
+            if include_user_ids:
+                user_ids = [id for id in user_ids if id in include_user_ids]
+            yield user_ids, next_cursor
+
+    def get_friends(self, user, cursor=-1, count=5000, iterate=True, verbose=False):
+        friend_ids = []
+        for user_ids in self.iter_friends(user, cursor, count, iterate, verbose):
+            friend_ids += user_ids
+        return friend_ids
+
+    def iter_friends(self, user, cursor=-1, count=5000, iterate=True, verbose=False):
+        """
+        Yields the ids of the users user follows, page by page.
+        """
+        url = self.base_url + '/friends/ids.json'
+        for user_ids, next_cursor in self._iter_cursor_pages(url, user, cursor, count, iterate, verbose):
+            yield user_ids
+
+    def _iter_cursor_pages(self, url, user, cursor, count, iterate, verbose, errors=None):
         params = {'cursor': cursor,
                   'count': count}
         if type(user) == str:
@@ -68,119 +151,145 @@ class Twitter():
             params['user_id'] = user
         else:
             raise TypeError("'user' must be str or int, not {}".format(type(user)))
-        r = self._request(url, params)
-        if verbose:
-            print('Volgers binnenhalen van gebruiker {} ...'.format(str(user)))
-        user_ids = r.json()
-        while 'errors' in user_ids:
-            if user_ids['errors'][0]['code'] == 88:
-                self._wait('/followers/ids', verbose)
-                r = self._request(url, params)
-                user_ids = r.json()
-            elif self.logging_on:
-                self.logger.error('Fout bij gebruiker {}, geen volgers binnengehaald'.format(str(user)))
-                return []
-            else:
-                return []
-        try:
-            if include_user_ids:
-                followers_to_include = [id for id in user_ids['ids'] if id in include_user_ids]
-            else:
-                followers_to_include = user_ids['ids']
-        except KeyError:
-            if self.logging_on:
-                self.logger.error('Fout bij gebruiker {} ("KeyError"), geen volgers binnengehaald'.format(str(user)))
+        while True:
+            r = self._request(url, params, verbose=verbose)
+            user_ids = r.json() if r.status_code < 500 else {}
+            if 'errors' in user_ids or 'ids' not in user_ids:
+                if errors is not None:
+                    errors.append(r.status_code)
+                if self.logging_on:
+                    self.logger.error('Fout bij gebruiker {}, geen gebruikers binnengehaald via {}'.format(
+                        str(user), self._get_resource(url)))
+                return
+            next_cursor = user_ids.get('next_cursor', 0)
+            yield user_ids['ids'], next_cursor
+            if next_cursor == 0 or not iterate:
+                return
+            params['cursor'] = next_cursor
+
+    def get_user_info(self, users, verbose = False, concurrency=1, chunk_retries=3, sink=None):
+        """
+        :param users: list, string or int
+        :param concurrency: number of 100-user chunks fetched at the same time
+        :param chunk_retries: number of extra attempts for a chunk that failed
+        :param sink: sink from emma_toolkit.twitter.sinks the user objects are written to instead
+                     of being kept in memory; the returned list is then empty
+        :return: list of user objects, in the order of the chunks
+        """
+        if self.cache and isinstance(users, list) and sink:
+            # Bounds the users read from the cache at once
+            for chunk in self._create_chunks(users, 10000):
+                self._get_cached_user_info(chunk, verbose, concurrency, chunk_retries, sink)
             return []
-        follower_ids += followers_to_include
-        while 'next_cursor' in user_ids and user_ids['next_cursor'] != 0 and iterate:
-            params['cursor'] = user_ids['next_cursor']
-            r = self._request(url, params)
-            user_ids = r.json()
-            while 'errors' in user_ids:
-                if user_ids['errors'][0]['code'] == 88:
-                    self._wait('/followers/ids', verbose)
-                    r = self._request(url, params)
-                    user_ids = r.json()
-                elif self.logging_on:
-                    self.logger.error('Fout bij gebruiker {}, geen volgers binnengehaald'.format(str(user)))
-                    return []
-                else:
-                    return []
-            if include_user_ids:
-                followers_to_include = [id for id in user_ids['ids'] if id in include_user_ids]
-            else:
-                followers_to_include = user_ids['ids']
-            follower_ids += followers_to_include
-        return follower_ids
+        if self.cache and isinstance(users, (list, str, int)):
+            return self._get_cached_user_info(users, verbose, concurrency, chunk_retries, sink)
+        return self._fetch_user_info(users, verbose, concurrency, chunk_retries, sink)
 
-    def get_friends(self, user, cursor=-1, count=5000, iterate=True, verbose=False):
-        if '/friends/ids' not in self.rate_limits:
-            self.rate_limits['/friends/ids'] = self.get_rate_limit('friends')['friends']['/friends/ids']
-        if self.rate_limits['/friends/ids']['remaining'] == 0:
-            self._wait('/friends/ids', verbose)
-        friend_ids = []
-        url = self.base_url + '/friends/ids.json'
-        params = {'cursor': cursor,
-                  'screen_name': user,
-                  'count': count}
-        r = self._request(url, params)
-        self.rate_limits['/friends/ids']['remaining'] -= 1
-        user_ids = r.json()
-        friend_ids += user_ids['ids']
-        while 'next_cursor' in user_ids and user_ids['next_cursor'] != 0 and iterate:
-            if self.rate_limits['/friends/ids']['remaining'] == 0:
-                self._wait('/friends/ids', verbose)
-            params['cursor'] = user_ids['next_cursor']
-            r = self._request(url, params)
-            self.rate_limits['/friends/ids']['remaining'] -= 1
-            user_ids = r.json()
-            friend_ids += user_ids['ids']
-        return friend_ids
+    def cache_stats(self):
+        """
+        :return: Dict: {endpoint: {hits, misses}} of the response cache
+        """
+        return self.cache.stats() if self.cache else {}
+
+    def _get_cached_user_info(self, users, verbose, concurrency, chunk_retries, sink):
+        """
+        Serves cached users from the cache and looks up only the misses. Users are
+        cached under both their id and their screen name.
+        """
+        users_list = users if isinstance(users, list) else [users]
+        keys = [self._get_user_cache_key(user) for user in users_list]
+        cached = self.cache.get_many('/users/lookup', keys)
+        misses = list(dict.fromkeys(user for user, key in zip(users_list, keys) if key not in cached))
+        if misses:
+            new_entries = {}
+            for user in self._fetch_user_info(misses, verbose, concurrency, chunk_retries):
+                new_entries[self._get_user_cache_key(user['id'])] = user
+                new_entries[self._get_user_cache_key(user['screen_name'])] = user
+            self.cache.set_many('/users/lookup', new_entries)
+            cached.update(new_entries)
+        user_info = []
+        user_ids = set()
+        for key in keys:
+            if key in cached and cached[key]['id'] not in user_ids:
+                user_ids.add(cached[key]['id'])
+                user_info.append(cached[key])
+        if sink:
+            sink.write_many(user_info)
+            sink.flush()
+            return []
+        return user_info
+
+    def _get_user_cache_key(self, user):
+        return str(user) if isinstance(user, int) else '@' + user.lower()
 
-    def get_user_info(self, users, verbose = False):
-        if '/users/lookup' not in self.rate_limits:
-            self.rate_limits['/users/lookup'] = self.get_rate_limit('users')['users']['/users/lookup']
-        if self.rate_limits['/users/lookup']['remaining'] == 0:
-            self._wait('/users/lookup', verbose)
+    def _fetch_user_info(self, users, verbose=False, concurrency=1, chunk_retries=3, sink=None):
         url = self.base_url + '/users/lookup.json'
         user_info = []
         if isinstance(users, list):
-            method = 'POST'
-            if len(users) > 100:
-                chunks = self._create_chunks(users, 100)
+            chunks = list(self._create_chunks(users, 100))
+            if concurrency > 1 and len(chunks) > 1:
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    results = executor.map(lambda chunk: self._lookup_users(url, chunk, chunk_retries, verbose),
+                                           chunks)
+                    for r in results:
+                        if sink:
+                            sink.write_many(r)
+                        else:
+                            user_info += r
             else:
-                chunks = [users]
-            for chunk in chunks:
-                if self.rate_limits['/users/lookup']['remaining'] == 0:
-                    self._wait('/users/lookup', verbose)
-                if isinstance(users[0], int):
-                    params = {'user_id': ','.join([str(user) for user in chunk])}
-                else:
-                    params = {'screen_name': ','.join(chunk)}
-                r = self._request(url, params, method).json()
-                self.rate_limits['/users/lookup']['remaining'] -= 1
-                user_info += r
+                for chunk in chunks:
+                    r = self._lookup_users(url, chunk, chunk_retries, verbose)
+                    if sink:
+                        sink.write_many(r)
+                    else:
+                        user_info += r
         elif isinstance(users, str):
             method = 'GET'
             params = {'screen_name': users}
-            r = self._request(url, params, method).json()
-            self.rate_limits['/users/lookup']['remaining'] -= 1
+            r = self._request(url, params, method, verbose=verbose).json()
             user_info += r
         elif isinstance(users, int):
             method = 'GET'
             params = {'user_id': users}
-            r = self._request(url, params, method).json()
-            self.rate_limits['/users/lookup']['remaining'] -= 1
+            r = self._request(url, params, method, verbose=verbose).json()
             user_info += r
         else:
             raise TypeError("Users should be list, string or int, not {}.".format(str(type(users))))
+        if sink:
+            if not isinstance(users, list):
+                sink.write_many(user_info)
+            sink.flush()
+            return []
         return user_info
 
-    def get_recent_tweets(self, user, count=3200, start_date=None, include_rts=True, verbose=False):
-        if '/statuses/user_timeline' not in self.rate_limits:
-            self.rate_limits['/statuses/user_timeline'] = self.get_rate_limit('statuses')['statuses']['/statuses/user_timeline']
-        if self.rate_limits['/statuses/user_timeline']['remaining'] == 0:
-            self._wait('/statuses/user_timeline', verbose)
+    def get_recent_tweets(self, user, count=3200, start_date=None, include_rts=True, verbose=False, sink=None,
+                          since_id=None):
+        """
+        :param sink: sink from emma_toolkit.twitter.sinks the tweets are written to page by page
+                     instead of being kept in memory; the returned list is then empty
+        :param since_id: only return tweets newer than this tweet id
+        """
+        tweets = []
+        for page in self.iter_timeline(user, count, start_date, include_rts, verbose, since_id):
+            if sink:
+                sink.write_many(page)
+                sink.flush()
+            else:
+                tweets += page
+        return tweets
+
+    def iter_timeline(self, user, count=3200, start_date=None, include_rts=True, verbose=False, since_id=None,
+                      max_id=None, errors=None):
+        """
+        Yields the tweets of user page by page, newest first, until count tweets
+        are fetched, start_date is reached or, if given, since_id is reached.
+        With since_id, paging only stops at an empty page, as pages can be short
+        (e.g. without retweets) before since_id is reached.
+
+        :param max_id: only yield tweets up to this id
+        :param errors: list the reason is appended to when paging stops before the
+                       end (an error, or count reached before since_id)
+        """
         url = self.base_url + '/statuses/user_timeline.json'
         if isinstance(user, str):
             params = {'screen_name': user}
@@ -192,19 +301,18 @@ class Twitter():
             params['include_rts'] = 1
         else:
             params['include_rts'] = 0
+        if since_id:
+            params['since_id'] = since_id
+        if max_id:
+            params['max_id'] = max_id
         params['count'] = 200 if count >= 200 else count
         iterations = int(math.ceil(count / 200))
         if start_date:
             start_timestamp = datetime.datetime.timestamp(start_date)
         else:
             start_timestamp = 0
-        all_tweets = []
-        date_format = '%a %b %d %H:%M:%S %z %Y'
         for i in range(iterations):
-            if self.rate_limits['/statuses/user_timeline']['remaining'] == 0:
-                self._wait('/statuses/user_timeline', verbose)
-            r = self._request(url, params).json()
-            self.rate_limits['/statuses/user_timeline']['remaining'] -= 1
+            r = self._request(url, params, verbose=verbose).json()
             if 'error' in r:
                 error = r['error']
             elif 'errors' in r:
@@ -213,24 +321,79 @@ class Twitter():
                 error = None
             if error:
                 if verbose:
-                    print("Error for user {}: '{}'. Returning nothing.".format(user, error))
-                return []
+                    print("Error for user {}: '{}'. Stopping.".format(user, error))
+                if errors is not None:
+                    errors.append(error)
+                return
             if len(r) == 0:
-                if verbose:
+                if verbose and i == 0:
                     print("No tweets for user {}. Returning nothing.".format(user))
-                return []
-            all_tweets += r
+                return
             params['max_id'] = r[-1]['id'] - 1
-            last_date = r[-1]['created_at']
-            last_timestamp = datetime.datetime.timestamp(datetime.datetime.strptime(last_date, date_format))
-            if last_timestamp < start_timestamp or len(r) < params['count']:
-                break
-        tweets = []
-        for tweet in all_tweets:
-            timestamp = datetime.datetime.timestamp(datetime.datetime.strptime(tweet['created_at'], date_format))
-            if timestamp > start_timestamp:
-                tweets.append(tweet)
-        return tweets
+            timestamps = [self._parse_timestamp(tweet['created_at']) for tweet in r]
+            yield [tweet for tweet, timestamp in zip(r, timestamps) if timestamp > start_timestamp]
+            if timestamps[-1] < start_timestamp or (not since_id and len(r) < params['count']):
+                return
+        if since_id and errors is not None:
+            errors.append('count of {} tweets reached before since_id'.format(count))
+
+    def sync_timelines(self, users, state_file, count=3200, include_rts=True, verbose=False, sink=None):
+        """
+        Fetches only the tweets posted since the previous sync of every user. The
+        id of the newest tweet per user is kept in state_file, so a user without
+        new tweets costs a single request. When a sync of a user stops before it
+        reaches the previous sync (an error, or more than count new tweets), the
+        tweets in between are fetched first in the next sync.
+
+        :param users: list of screen names or user ids
+        :param state_file: name of a SQLite file
+        :param count: maximum number of tweets fetched per user and sync
+        :param sink: sink the tweets are written to instead of being kept in memory
+        :return: Dict: {user: list of new tweets}, with empty lists when a sink is given
+        """
+        state = TimelineState(state_file)
+        new_tweets = {}
+        try:
+            for user in users:
+                tweets = []
+                new_tweets[user] = tweets
+                options = {'count': count, 'include_rts': include_rts, 'verbose': verbose}
+                gap = state.get_gap(user)
+                if gap:
+                    _, oldest_id, complete = self._sync_timeline(user, tweets, sink, gap[0], gap[1], **options)
+                    if not complete:
+                        # The new tweets wait until the gap is filled, so there is at most one gap
+                        if oldest_id:
+                            state.set_gap(user, (gap[0], oldest_id - 1))
+                        continue
+                    state.set_gap(user, None)
+                since_id = state.get_since_id(user)
+                newest_id, oldest_id, complete = self._sync_timeline(user, tweets, sink, since_id, None, **options)
+                if newest_id:
+                    state.set_since_id(user, newest_id, gap=None if complete else (since_id, oldest_id - 1))
+        finally:
+            state.close()
+        return new_tweets
+
+    def _sync_timeline(self, user, tweets, sink, since_id, max_id, **options):
+        # Returns the newest and oldest id fetched, and whether since_id was reached without errors
+        errors = []
+        newest_id = None
+        oldest_id = None
+        for page in self.iter_timeline(user, since_id=since_id, max_id=max_id, errors=errors, **options):
+            if page:
+                ids = [tweet['id'] for tweet in page]
+                newest_id = max(ids + [newest_id or 0])
+                oldest_id = min(ids + [oldest_id or ids[0]])
+            if sink:
+                sink.write_many(page)
+                sink.flush()
+            else:
+                tweets += page
+        return newest_id, oldest_id, not errors
+
+    def _parse_timestamp(self, created_at):
+        return datetime.datetime.strptime(created_at, '%a %b %d %H:%M:%S %z %Y').timestamp()
 
     def follow_user(self, user):
         url = self.base_url + '/friendships/create.json'
@@ -245,10 +408,6 @@ class Twitter():
         return r
 
     def search_users(self, query, users_to_return=20, verbose=False):
-        if '/users/search' not in self.rate_limits:
-            self.rate_limits['/users/search'] = self.get_rate_limit('users')['users']['/users/search']
-        if self.rate_limits['/users/search']['remaining'] == 0:
-            self._wait('/users/search', verbose)
         url = self.base_url + '/users/search.json'
         count = 20
         user_info = []
@@ -257,71 +416,180 @@ class Twitter():
                   'page': 1}
         iterations = int(math.ceil(users_to_return / 20))
         for i in range(iterations):
-            if self.rate_limits['/users/search']['remaining'] == 0:
-                self._wait('/users/search', verbose)
             params['page'] += 1
-            r = self._request(url, params, method="GET").json()
+            r = self._request(url, params, method="GET", verbose=verbose).json()
             user_info += r
-            self.rate_limits['/users/search']['remaining'] -= 1
             if len(r) < count:
                 break
         return user_info
 
-    def get_follow_network(self, user_screen_names, verbose=False, get_time_estimate=False):
-        users_info = self.get_user_info(user_screen_names, verbose=verbose)
-        if get_time_estimate:
-            amount_of_followers = [user['followers_count'] for user in users_info]
-            amount_of_iterations = int(sum([math.ceil(x / 5000) for x in amount_of_followers]))
-            time_to_collect_network = str(datetime.timedelta(minutes=amount_of_iterations))[:-3]
-            eta = datetime.datetime.now() + datetime.timedelta(minutes=amount_of_iterations)
-            print('Dit netwerk duurt ongeveer {} uur om binnen te halen ({})'.format(time_to_collect_network, eta))
+    def get_follow_network(self, user_screen_names, verbose=False, get_time_estimate=False, state_file=None,
+                           resume=False, sink=None, as_graph=False, order='input', snapshot_dir=None):
+        """
+        :param user_screen_names: list of screen names
+        :param state_file: name of a SQLite file in which the crawl is checkpointed after every page
+        :param resume: continue the crawl stored in state_file instead of starting over
+        :param sink: sink from emma_toolkit.twitter.sinks the edges are written to per page,
+                     defaults to temp_file. On resume, temp_file is first rewritten with the
+                     edges stored in state_file, as the new client emptied it. Edges written to a sink passed here are not kept
+                     in memory, so the returned edges are empty, unless as_graph or
+                     snapshot_dir needs them
+        :param as_graph: return a Graph instead of a dict
+        :param order: 'input' to crawl the users in the given order, or 'cheapest' to crawl
+                      the users with the fewest followers first
+        :param snapshot_dir: directory of a SnapshotStore the network is added to as a new
+                             snapshot, stored as the changes since the previous one
+        :return: Dict: {nodes, edges}, or Graph
+        """
+        temp_sink = None
+        state = CrawlState(state_file) if state_file else None
+        try:
+            if sink is None and self.temp_file:
+                resuming = state is not None and resume and state.has_users()
+                sink = temp_sink = CSVSink(self.temp_file, ['source', 'target'], append=not resuming)
+                if resuming:
+                    temp_sink.write_many(state.get_edges())
+            collect = temp_sink is not None or sink is None or as_graph or bool(snapshot_dir)
+            users_info, edges = self._crawl_follow_network(user_screen_names, verbose, get_time_estimate, state,
+                                                           resume, sink, order, collect)
+        finally:
+            if temp_sink:
+                temp_sink.close()
+            if state:
+                state.close()
+        if snapshot_dir:
+            edge_array = np.array(edges, dtype='int64').reshape(-1, 2)
+            snapshot_id = SnapshotStore(snapshot_dir).add(edge_array[:, 0], edge_array[:, 1], users_info)
+            if verbose:
+                print('Netwerk opgeslagen als snapshot {} in {}'.format(snapshot_id, snapshot_dir))
+        if as_graph:
+            return Graph.from_edges([edge[0] for edge in edges], [edge[1] for edge in edges], nodes=users_info)
+        return({'nodes': users_info, 'edges': edges})
+
+    def _crawl_follow_network(self, user_screen_names, verbose, get_time_estimate, state, resume, sink, order,
+                              collect):
+        if state and resume and state.has_users():
+            users_info = state.get_nodes()
+            if verbose:
+                print('Netwerk hervatten vanuit {}'.format(state.path))
+        else:
+            users_info = self.get_user_info(user_screen_names, verbose=verbose)
+            if state:
+                state.reset()
+                state.set_nodes(users_info)
+        planner = CrawlPlanner(users_info, self.rate_limiters, self.metrics, order=order)
         user_ids = [user['id'] for user in users_info]
+        if state:
+            pending_users = state.pending_users()
+            for user_id in set(user_ids) - set(user_id for user_id, cursor in pending_users):
+                planner.mark_done(user_id)
+            planner.set_pages(state.get_pages())
+        else:
+            pending_users = [(user_id, -1) for user_id in user_ids]
+        if get_time_estimate:
+            self._print_time_estimate(planner)
+            last_estimate = time.time()
         edges = []
-        for user_id in user_ids:
-            follower_ids = self.get_followers(user_id, include_user_ids=user_ids, verbose=verbose)
-            for follower_id in follower_ids:
-                edges.append((follower_id, user_id))
-                if self.temp_file:
-                    with open(self.temp_file, 'ab') as f:
-                        writer = csv.writer(f, encoding='utf-8', delimiter=',')
-                        writer.writerow([follower_id, user_id])
-                        f.close()
-        return({'nodes': users_info, 'edges': edges})
+        for user_id, cursor in planner.schedule(pending_users):
+            errors = []
+            for follower_ids, next_cursor in self._iter_follower_pages(user_id, include_user_ids=user_ids,
+                                                                      cursor=cursor, verbose=verbose, errors=errors):
+                planner.record_page(user_id)
+                page_edges = [(follower_id, user_id) for follower_id in follower_ids]
+                if state:
+                    state.save_page(user_id, page_edges, next_cursor)
+                elif collect:
+                    edges += page_edges
+                if sink:
+                    sink.write_many(page_edges)
+                    sink.flush()
+                if get_time_estimate and time.time() - last_estimate >= 60:
+                    self._print_time_estimate(planner)
+                    last_estimate = time.time()
+            if errors and self._is_transient_error(errors[-1]):
+                if state:
+                    # Not done: a resumed crawl retries this user from the last stored cursor
+                    if verbose:
+                        print('Fout {} bij gebruiker {}, later opnieuw proberen met resume=True'.format(
+                            errors[-1], user_id))
+                else:
+                    self.transport.logger.error('Fout {} bij gebruiker {}, volgers onvolledig binnengehaald'.format(
+                        errors[-1], user_id))
+            elif state and errors:
+                # Protected, suspended or deleted: no more pages will come
+                state.mark_done(user_id)
+            planner.mark_done(user_id)
+        if state and collect:
+            edges = state.get_edges()
+        return users_info, edges
+
+    def _is_transient_error(self, status_code):
+        return status_code >= 500 or status_code in (420, 429)
+
+    def _print_time_estimate(self, planner):
+        progress = planner.progress()
+        time_to_collect_network = str(datetime.timedelta(seconds=int(progress['seconds_remaining'])))[:-3]
+        eta = progress['eta'].strftime('%Y-%m-%d %H:%M')
+        if progress['pages_done']:
+            print('{}: {} van {} gebruikers binnen, nog ongeveer {} uur ({})'.format(
+                time.strftime('%H:%M:%S'), progress['users_done'], progress['users_done'] +
+                progress['users_remaining'], time_to_collect_network, eta))
+        else:
+            print('Dit netwerk duurt ongeveer {} uur om binnen te halen ({})'.format(time_to_collect_network, eta))
 
-    def get_mentions_network(self, tweets, author_col, tweet_col, method = 'mentions', verbose = False):
+    def get_mentions_network(self, tweets, author_col, tweet_col, method = 'mentions', verbose = False,
+                             as_graph = False):
         """
-        :param tweets: Pandas Dataframe
+        :param tweets: Pandas Dataframe, or an iterable of DataFrames (e.g. from pd.read_csv with chunksize)
         :param author_col: String
         :param tweet_col: String
         :param method: String: ['mentions', 'retweets', 'mentions_and_retweets']
-        :return: Dict: {nodes, edges}
+        :param as_graph: return a Graph, with screen names as node ids and the counts as weights
+        :return: Dict: {nodes, edges}; edges is a DataFrame with source, target and count. Or Graph
         """
-        tweets['is_retweet'] = tweets[tweet_col].str.startswith('RT @')
+        if method not in ['mentions', 'retweets', 'mentions_and_retweets']:
+            raise ValueError('Parameter "method" should be one of [mentions, retweets, mentions_and_retweets]')
+        if isinstance(tweets, pd.DataFrame):
+            tweets = [tweets]
+        edge_counts = []
+        for chunk in tweets:
+            edge_counts.append(self._count_mentions(chunk, author_col, tweet_col, method))
+            if len(edge_counts) >= 64:
+                # Summing now and then bounds the memory of the counts per chunk
+                edge_counts = [self._sum_edge_counts(edge_counts)]
+        edges = self._sum_edge_counts(edge_counts).astype('int64').rename('count').reset_index()
+        alle_tweeps = list(set(edges['source']) | set(edges['target']))
+        nodes = self.get_user_info(alle_tweeps, verbose=verbose) if alle_tweeps else []
+        if as_graph:
+            return Graph.from_edges(edges['source'], edges['target'], edges['count'], nodes=nodes,
+                                    node_ids=[node['screen_name'].lower() for node in nodes])
+        return({'nodes': nodes, 'edges': edges})
+
+    def _count_mentions(self, tweets, author_col, tweet_col, method):
+        tweets = tweets.loc[tweets[tweet_col].notnull(), [author_col, tweet_col]]
+        is_retweet = tweets[tweet_col].str.startswith('RT @')
         if method == 'mentions':
-            tweets = tweets.loc[tweets['is_retweet'] == False, :]
-            exp = re.compile(r'@(\w+)')
+            tweets = tweets[~is_retweet]
+            exp = r'@(\w+)'
         elif method == 'retweets':
-            tweets = tweets.loc[tweets['is_retweet'] == True, :]
-            exp = re.compile(r'^RT @(\w+)')
-        elif method == 'mentions_and_retweets':
-            exp = re.compile(r'@(\w+)')
+            tweets = tweets[is_retweet]
+            exp = r'^RT @(\w+)'
         else:
-            raise ValueError('Parameter "method" should be one of [mentions, retweets, mentions_and_retweets]')
-        tweets['mentions'] = tweets[tweet_col].apply(lambda x: re.findall(exp, x))
-        mentions_per_auteur = tweets.groupby(author_col)['mentions'].sum()
-        edges = []
-        alle_tweeps = []
-        for index, mentions in mentions_per_auteur.iteritems():
-            source = index
-            targets = mentions
-            for target in targets:
-                edges.append((source.lower(), target.lower()))
-                alle_tweeps.append(source.lower())
-                alle_tweeps.append(target.lower())
-
-        alle_tweeps = list(set(alle_tweeps))
-        nodes = self.get_user_info(alle_tweeps, verbose=verbose)
-        return({'nodes': nodes, 'edges': edges})
+            exp = r'@(\w+)'
+        tweets = tweets.reset_index(drop=True)
+        mentions = tweets[tweet_col].str.extractall(exp)[0]
+        positions = mentions.index.get_level_values(0).astype('int64')
+        edges = pd.DataFrame({'source': tweets[author_col].to_numpy()[positions],
+                              'target': mentions.to_numpy()})
+        edges['source'] = edges['source'].str.lower()
+        edges['target'] = edges['target'].str.lower()
+        return edges.groupby(['source', 'target']).size()
+
+    def _sum_edge_counts(self, edge_counts):
+        if not edge_counts:
+            return pd.Series([], index=pd.MultiIndex.from_arrays([[], []], names=['source', 'target']),
+                             dtype='int64')
+        return pd.concat(edge_counts).groupby(level=['source', 'target']).sum()
 
     def get_hashtags_network(self, tweets, include_retweets = True):
         """
@@ -342,6 +610,47 @@ class Twitter():
                         co_hashtags.append((hashtags[x].lower(), hashtags[y].lower()))
         return co_hashtags
 
+    def get_hashtags_matrix(self, tweets, include_retweets = True, processes = 1, chunksize = 100000):
+        """
+        Counts how often every pair of hashtags occurs in the same tweet. Hashtags
+        are mapped to integer ids and the counts are kept in a sparse matrix.
+        With processes > 1 the tweets are counted in chunks in a process pool and
+        the partial matrices are merged.
+
+        :param tweets: Iterable
+        :return: Dict: {vocabulary, matrix}; vocabulary is a list of hashtags, matrix
+                 a scipy.sparse CSR matrix with the count of (vocabulary[i], vocabulary[j])
+                 at [i, j], with i <= j
+        """
+        if sparse is None:
+            raise ImportError("get_hashtags_matrix requires scipy, install it with 'pip install scipy'")
+        tweets = iter(tweets)
+        chunks = iter(lambda: list(itertools.islice(tweets, chunksize)), [])
+        count_chunk = functools.partial(_count_hashtag_pairs, include_retweets=include_retweets)
+        if processes > 1:
+            with multiprocessing.Pool(processes) as pool:
+                return self._merge_hashtag_counts(pool.imap(count_chunk, chunks))
+        return self._merge_hashtag_counts(map(count_chunk, chunks))
+
+    def _merge_hashtag_counts(self, partial_counts):
+        vocabulary = {}
+        rows, cols, counts = [], [], []
+        for chunk_vocabulary, chunk_matrix in partial_counts:
+            ids = np.array([vocabulary.setdefault(hashtag, len(vocabulary)) for hashtag in chunk_vocabulary],
+                           dtype='int64')
+            chunk_rows = ids[chunk_matrix.row]
+            chunk_cols = ids[chunk_matrix.col]
+            rows.append(np.minimum(chunk_rows, chunk_cols))
+            cols.append(np.maximum(chunk_rows, chunk_cols))
+            counts.append(chunk_matrix.data)
+        size = len(vocabulary)
+        if rows:
+            matrix = sparse.coo_matrix((np.concatenate(counts), (np.concatenate(rows), np.concatenate(cols))),
+                                       shape=(size, size)).tocsr()
+        else:
+            matrix = sparse.csr_matrix((size, size), dtype='int64')
+        return {'vocabulary': list(vocabulary), 'matrix': matrix}
+
     def get_rate_limit(self, resources):
         url = self.base_url + '/application/rate_limit_status.json'
         if isinstance(resources, list):
@@ -363,20 +672,48 @@ class Twitter():
         for i in range(0, len(l), n):
             yield l[i:i+n]
 
-    def _request(self, url, params, method='GET'):
-        try:
-            if method == 'GET':
-                r = requests.get(url=url, params=params, auth=self.oauth)
-            elif method == 'POST':
-                r = requests.post(url=url, params=params, auth=self.oauth)
-            else:
-                raise TypeError("'Method' should be either POST or GET.")
-        except requests.exceptions.ConnectionError:
-            if self.logging_on:
-                logging.error('Connection error, nog een poging over 15 min.')
-                time.sleep(15)
-            self._request(url, params, method)
-        return r
+    def _lookup_users(self, url, chunk, retries, verbose=False):
+        if isinstance(chunk[0], int):
+            params = {'user_id': ','.join([str(user) for user in chunk])}
+        else:
+            params = {'screen_name': ','.join(chunk)}
+        for attempt in range(retries + 1):
+            try:
+                r = self._request(url, params, 'POST', verbose=verbose)
+            except requests.exceptions.RequestException:
+                continue
+            if r.status_code >= 500:
+                continue
+            result = r.json()
+            # Twitter answers with an error object when none of the users exist
+            return result if isinstance(result, list) else []
+        if self.logging_on:
+            self.logger.error('Fout bij ophalen van {} gebruikers vanaf {}, overgeslagen'.format(len(chunk), chunk[0]))
+        return []
+
+    def _request(self, url, params, method='GET', verbose=False):
+        resource = self._get_resource(url)
+        while True:
+            token = self._wait(resource, verbose)
+            try:
+                r = self.transport.request(method, url, endpoint=resource, params=params,
+                                           auth=self.credentials[token])
+            except requests.exceptions.RequestException:
+                if self.logging_on:
+                    self.logger.error('Verbindingsfout bij {}, geen pogingen meer over.'.format(url))
+                raise
+            if r.status_code == 429:
+                self.rate_limiters[token].exhaust(resource, r.headers)
+                continue
+            self.rate_limiters[token].update(resource, r.headers)
+            self.metrics.record_quota(resource, sum(self.rate_limiters[token].remaining(resource) or 0
+                                                    for token in range(len(self.credentials))))
+            return r
+
+    def _get_resource(self, url):
+        path = parse.urlparse(url).path
+        path = re.sub(r'^/1\.1', '', path)
+        return re.sub(r'\.json$', '', path)
 
     def _setup_log(self, log_file):
         logger = logging.getLogger(__name__)
@@ -392,23 +729,65 @@ class Twitter():
         logger.addHandler(f_handler)
         return logger
 
+    def _select_token(self, resource):
+        """
+        Reserves a call on the token with the most remaining quota for resource.
+        Returns the index of that token and 0, or None and the number of seconds
+        until the first token has quota again.
+        """
+        def remaining(token):
+            remaining = self.rate_limiters[token].remaining(resource)
+            return float('inf') if remaining is None else remaining
+        tokens = sorted(range(len(self.credentials)), key=remaining, reverse=True)
+        times_to_sleep = []
+        for token in tokens:
+            time_to_sleep = self.rate_limiters[token].acquire(resource)
+            if not time_to_sleep:
+                return token, 0
+            times_to_sleep.append(time_to_sleep)
+        return None, min(times_to_sleep)
+
     def _wait(self, resource, verbose = False):
-        # Rate limit opnieuw checken voor de zekerheid
-        main_resource = re.findall(r'/(\w+)/', resource)[0]
-        new_rate_limit = self.get_rate_limit(main_resource)[main_resource][resource]
-        self.rate_limits[resource] = new_rate_limit
-        rate_limit_reset = self.rate_limits[resource]['reset']
-        now = time.time()
-        time_to_sleep = rate_limit_reset - now + 5
+        """
+        Waits until one of the tokens has quota for resource and returns its index.
+        """
+        token, time_to_sleep = self._select_token(resource)
+        if not time_to_sleep:
+            return token
         resume = datetime.datetime.now() + datetime.timedelta(seconds=time_to_sleep)
         if verbose:
             print('{}: Rate limit voor {}. Wachten tot {}.'.format(
                 time.strftime('%H:%M:%S'), resource, resume.strftime('%H:%M:%S')))
-        if time_to_sleep < 0:
-            time_to_sleep = 900
-        time.sleep(time_to_sleep)
-        new_rate_limit = self.get_rate_limit(main_resource)[main_resource][resource]
-        self.rate_limits[resource] = new_rate_limit
+        while time_to_sleep:
+            time.sleep(time_to_sleep)
+            self.metrics.record_sleep(resource, time_to_sleep)
+            token, time_to_sleep = self._select_token(resource)
         if verbose:
             print('{}: We gaan verder met data binnenhalen via {}.'.format(
-                time.strftime('%H:%M:%S'), resource))
\ No newline at end of file
+                time.strftime('%H:%M:%S'), resource))
+        return token
+
+
+def _count_hashtag_pairs(tweets, include_retweets=True):
+    """
+    Counts the hashtag pairs of one chunk of tweets for get_hashtags_matrix.
+    Returns the vocabulary of the chunk and a COO matrix with the pair counts.
+    """
+    hashtags_re = re.compile(r'#(\w+)')
+    vocabulary = {}
+    rows = []
+    cols = []
+    for tweet in tweets:
+        if type(tweet) != str or (not include_retweets and tweet.startswith('RT @')):
+            continue
+        hashtags = [vocabulary.setdefault(hashtag.lower(), len(vocabulary))
+                    for hashtag in re.findall(hashtags_re, tweet)]
+        result_len = len(hashtags)
+        for x in range(0, result_len):
+            for y in range((x + 1), result_len):
+                rows.append(hashtags[x])
+                cols.append(hashtags[y])
+    size = len(vocabulary)
+    matrix = sparse.coo_matrix((np.ones(len(rows), dtype='int64'), (rows, cols)), shape=(size, size))
+    matrix.sum_duplicates()
+    return list(vocabulary), matrix
@@ -6,7 +6,9 @@ setup(name='emma_toolkit',
       description='EMMA toolkit',
       author='Kevin Willemsen',
       author_email='willemsen@emma.nl',
-      install_requires=['requests>=2', 'requests_oauthlib'],
+      install_requires=['requests>=2', 'requests_oauthlib', 'numpy', 'pandas', 'unicodecsv'],
+      extras_require={'geoparsing': ['pyarrow', 'scipy', 'pyahocorasick'],
+                      'twitter': ['scipy', 'pyarrow']},
       classifiers=['Programming Language :: Python :: 3',
                    'Programming Language :: Python :: 3.4',
                    'Programming Language :: Python :: 3.5',],